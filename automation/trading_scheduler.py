@@ -2,12 +2,13 @@
 """
 Trading Scheduler - Exécution des phases de trading aux bons horaires de marché
 """
-import subprocess
+import asyncio
+import os
 import sys
 from pathlib import Path
 
-def run_trading_phase(phase: str, day: str = None):
-    """Exécute une phase de trading"""
+async def run_trading_phase(phase: str, day: str = None):
+    """Exécute une phase de trading (awaitable: plusieurs phases peuvent être lancées via asyncio.gather)"""
     
     # Aller à la racine du projet
     project_dir = Path(__file__).parent.parent
@@ -16,19 +17,26 @@ def run_trading_phase(phase: str, day: str = None):
     python_exe = project_dir / ".venv" / "bin" / "python"
     
     # Construire la commande
-    cmd = [str(python_exe), "scripts/run_daily.py", phase]
+    cmd = [str(python_exe), "-u", "scripts/run_daily.py", phase]
     if day:
         cmd.extend(["--day", day])
     
     print(f"[TRADING] Exécution {phase.upper()}: {' '.join(cmd)}")
     
     # Définir PYTHONPATH et exécuter
-    import os
     env = os.environ.copy()
     env['PYTHONPATH'] = str(project_dir)
+    # sortie non bufferisée (run_daily et ses sous-process): les lignes arrivent au fil de l'eau via le PIPE
+    env['PYTHONUNBUFFERED'] = "1"
     
-    result = subprocess.run(cmd, cwd=project_dir, env=env)
-    return result.returncode
+    proc = await asyncio.create_subprocess_exec(*cmd, cwd=project_dir, env=env, stdout=asyncio.subprocess.PIPE)
+    
+    # Relayer la sortie ligne par ligne pendant l'exécution
+    async for line in proc.stdout:
+        sys.stdout.write(line.decode(errors="replace"))
+        sys.stdout.flush()
+    
+    return await proc.wait()
 
 def main():
     if len(sys.argv) < 2:
@@ -50,7 +58,7 @@ def main():
         print("❌ Phase inconnue. Utiliser: evening, preopen ou summary")
         return 1
     
-    return run_trading_phase(phase, day)
+    return asyncio.run(run_trading_phase(phase, day))
 
 if __name__ == "__main__":
     sys.exit(main())
\ No newline at end of file
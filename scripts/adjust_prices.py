@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 import argparse
+import functools
+import os
+import time
 from pathlib import Path
-import numpy as np
-import pandas as pd
-import polars as pl
 import logging
-from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+# numpy/pandas/polars/yfinance are imported inside the functions that use them, so --help stays cheap
 
 # Set up logging
 logging.basicConfig(
@@ -15,6 +20,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Yahoo throttles bursts: cap concurrent calls regardless of the worker count
+_YAHOO_SEM = threading.Semaphore(4)
+
+# yf.Ticker instances are reused across calls; history/dividends are also cached on disk (YahooCache)
+_TICKER_CACHE: dict[str, "yf.Ticker"] = {}
+
+# Same codec/statistics as src.data ingestion; _rebuild_window relies on the footer date stats
+_PARQUET_OPTS = {"compression": "zstd", "compression_level": 3, "statistics": True}
+
 def _load_params(path="config/params.yaml") -> dict:
     import yaml
     logger.info(f"Loading configuration from {path}")
@@ -27,54 +41,253 @@ def _load_params(path="config/params.yaml") -> dict:
         logger.error(f"Failed to load configuration: {e}")
         raise
 
-def _yahoo_series(ticker: str, start=None, end=None):
+def _yf_ticker(sym: str):
     import yfinance as yf
+    y = _TICKER_CACHE.get(sym)
+    if y is None:
+        y = _TICKER_CACHE[sym] = yf.Ticker(sym)
+    return y
+
+@dataclass(slots=True, frozen=True)
+class YahooCache:
+    """On-disk Yahoo payload cache: data.yahoo_cache_dir, entries live data.yahoo_cache_ttl_hours."""
+    root: Path
+    ttl_s: float
+
+    @classmethod
+    def from_params(cls, params: dict) -> "YahooCache | None":
+        d = params.get("data", {})
+        ttl_h = float(d.get("yahoo_cache_ttl_hours", 12) or 0)
+        root = d.get("yahoo_cache_dir", "~/.cache/statarb/yahoo")
+        if not root or ttl_h <= 0:
+            return None
+        return cls(Path(root).expanduser(), ttl_h * 3600)
+
+    def paths(self, ticker: str, start: str | None) -> tuple[Path, Path]:
+        # keyed on (ticker, start) only: `end` moves every day, the TTL bounds staleness instead
+        key = f"{ticker}_{start or 'max'}"
+        return self.root / f"{key}_hist.parquet", self.root / f"{key}_div.parquet"
+
+    def is_fresh(self, fp: Path) -> bool:
+        return fp.exists() and (time.time() - fp.stat().st_mtime) < self.ttl_s
+
+    def prune(self) -> int:
+        """Delete entries (and leftover temp files) older than the TTL; returns how many went."""
+        if not self.root.is_dir():
+            return 0
+        n = 0
+        cutoff = time.time() - self.ttl_s
+        for fp in self.root.iterdir():
+            try:
+                if fp.is_file() and fp.stat().st_mtime < cutoff:
+                    fp.unlink(); n += 1
+            except OSError:
+                pass
+        return n
+
+def _day_index(idx) -> "pd.DatetimeIndex":
+    """Day buckets (datetime64[D]) of a Yahoo index, using the exchange-local date for tz-aware stamps."""
+    import pandas as pd
+    if not isinstance(idx, pd.DatetimeIndex):
+        idx = pd.DatetimeIndex(idx)
+    if idx.tz is not None:
+        idx = idx.tz_localize(None)
+    return pd.DatetimeIndex(idx.values.astype("datetime64[D]"))
+
+def _read_disk_cache(cache: YahooCache | None, ticker: str, start: str | None):
+    import polars as pl
+    if cache is None:
+        return None
+    fp_hist, fp_div = cache.paths(ticker, start)
+    if not (cache.is_fresh(fp_hist) and cache.is_fresh(fp_div)):
+        return None
+    try:
+        df = pl.read_parquet(fp_hist).to_pandas().set_index("date")
+        div = pl.read_parquet(fp_div).to_pandas().set_index("date")["dividend"]
+        logger.debug(f"Loaded Yahoo payload for {ticker} from disk cache")
+        return df, div
+    except Exception as e:
+        logger.debug(f"Ignoring unreadable Yahoo cache for {ticker}: {e}")
+        return None
+
+def _write_disk_cache(cache: YahooCache | None, ticker: str, start: str | None, df: pd.DataFrame, div: pd.Series) -> None:
+    import pandas as pd, polars as pl
+    if cache is None:
+        return
+    fp_hist, fp_div = cache.paths(ticker, start)
+    frames = (
+        (fp_div, pl.DataFrame({"date": pd.DatetimeIndex(div.index), "dividend": div.to_numpy(dtype=float)})),
+        (fp_hist, pl.from_pandas(df.rename_axis("date").reset_index())),
+    )
+    try:
+        cache.root.mkdir(parents=True, exist_ok=True)
+        # temp file + os.replace: a killed run never leaves a truncated entry that looks fresh
+        for fp, frame in frames:
+            tmp = fp.with_name(f"{fp.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            frame.write_parquet(tmp)
+            os.replace(tmp, fp)
+    except Exception as e:
+        logger.debug(f"Could not write Yahoo cache for {ticker}: {e}")
+
+@functools.lru_cache(maxsize=None)
+def _yahoo_series_cached(ticker: str, start: str | None, end: str | None, cache: YahooCache | None = None):
+    import pandas as pd
+    cached = _read_disk_cache(cache, ticker, start)
+    if cached is not None:
+        return cached
+
     logger.debug(f"Fetching Yahoo data for {ticker} from {start} to {end}")
     try:
-        y = yf.Ticker(ticker)
-        if start is not None or end is not None:
-            hist = y.history(start=start, end=end, auto_adjust=False)
-        else:
-            hist = y.history(period="max", auto_adjust=False)
-        
+        with _YAHOO_SEM:
+            y = _yf_ticker(ticker)
+            if start is not None or end is not None:
+                hist = y.history(start=start, end=end, auto_adjust=False)
+            else:
+                hist = y.history(period="max", auto_adjust=False)
+            div = y.dividends
+
         if hist is None or hist.empty:
             raise RuntimeError(f"Yahoo returned empty history for {ticker}")
         
         logger.debug(f"Downloaded {len(hist)} records for {ticker}")
         
-        hist.index = pd.to_datetime(hist.index).tz_localize(None)
         df = pd.DataFrame({
-            "Close": hist["Close"].astype(float), 
-            "AdjClose": hist["Adj Close"].astype(float)
-        }, index=hist.index)
-        
-        div = y.dividends
-        try: 
-            div = div.tz_localize(None)
-        except Exception: 
-            pass
-        
+            "Close": hist["Close"].to_numpy(dtype=float),
+            "AdjClose": hist["Adj Close"].to_numpy(dtype=float)
+        }, index=_day_index(hist.index))
+
         logger.debug(f"Retrieved {len(div) if div is not None else 0} dividend records for {ticker}")
+        if div is None:
+            div = pd.Series(dtype=float)
+        else:
+            div = pd.Series(div.to_numpy(dtype=float), index=_day_index(div.index))
+        _write_disk_cache(cache, ticker, start, df, div)
         return df, div
         
     except Exception as e:
         logger.error(f"Failed to fetch Yahoo data for {ticker}: {e}")
         raise
 
-def _should_rebuild(pdf: pd.DataFrame, force: bool) -> bool:
+def _yahoo_series(ticker: str, start=None, end=None, cache: YahooCache | None = None):
+    # Memoized per (ticker, start, end) in-process, and on disk (YahooCache TTL) across runs.
+    # Callers must treat the returned frames as read-only since they are shared.
+    iso = lambda d: None if d is None else str(d)
+    return _yahoo_series_cached(ticker, iso(start), iso(end), cache)
+
+def _yahoo_batch(tickers: list[str], start, end, cache: YahooCache | None = None) -> dict[str, tuple[pd.DataFrame, pd.Series]]:
+    """One multi-symbol yf.download for the whole range instead of one round-trip per ticker."""
+    import pandas as pd
+    import yfinance as yf
+    start, end = str(start), str(end)
+    out = {}
+    for t in tickers:
+        cached = _read_disk_cache(cache, t, start)
+        if cached is not None:
+            out[t] = cached
+    todo = [t for t in tickers if t not in out]
+    if not todo:
+        return out
+
+    logger.info(f"Batch download of {len(todo)} tickers from Yahoo ({start} → {end})")
+    with _YAHOO_SEM:
+        raw = yf.download(todo, start=start, end=end, auto_adjust=False, actions=True,
+                          group_by="ticker", threads=True, progress=False)
+    if raw is None or raw.empty:
+        return out
+
+    def _slice(t: str) -> pd.DataFrame:
+        if isinstance(raw.columns, pd.MultiIndex):
+            return raw[t] if t in raw.columns.get_level_values(0) else pd.DataFrame()
+        return raw if len(todo) == 1 else pd.DataFrame()
+
+    frames = {t: _slice(t) for t in todo}
+
+    # yf has no batch dividends API; fall back to per-ticker calls only when actions are missing
+    need_div = [t for t in todo if "Dividends" not in frames[t].columns]
+    with ThreadPoolExecutor(max_workers=max(1, min(8, len(need_div) or 1))) as ex:
+        divs = dict(zip(need_div, ex.map(lambda t: _yf_ticker(t).dividends, need_div)))
+
+    for t in todo:
+        sub = frames[t].dropna(subset=["Close"]) if "Close" in frames[t].columns else pd.DataFrame()
+        if sub.empty:
+            continue
+        idx = _day_index(sub.index)
+        df = pd.DataFrame({
+            "Close": sub["Close"].to_numpy(dtype=float),
+            "AdjClose": sub["Adj Close"].to_numpy(dtype=float),
+        }, index=idx)
+        if t in divs:
+            div = pd.Series(divs[t].to_numpy(dtype=float), index=_day_index(divs[t].index)) if divs[t] is not None else pd.Series(dtype=float)
+        else:
+            # ex-div mask straight on the raw array (NaN → 0), no intermediate Series to align/filter
+            d = sub["Dividends"].to_numpy(dtype=float, na_value=0.0)
+            paid = d > 0
+            div = pd.Series(d[paid], index=idx[paid])
+        _write_disk_cache(cache, t, start, df, div)
+        out[t] = (df, div)
+    return out
+
+def _footer_info(fp: Path):
+    """(column names, row count, first date, last date) from the parquet footer, without decoding pages."""
+    import pyarrow.parquet as pq
+    md = pq.read_metadata(fp)
+    names = md.schema.names
+    dmin = dmax = None
+    if "date" in names and md.num_rows:
+        j = names.index("date")
+        stats = [md.row_group(i).column(j).statistics for i in range(md.num_row_groups)]
+        if md.schema.column(j).logical_type.type == "DATE" and all(s is not None and s.has_min_max for s in stats):
+            dmin, dmax = min(s.min for s in stats), max(s.max for s in stats)
+        else:
+            # timestamps or missing statistics: decode the date column only
+            import polars as pl
+            d = pl.read_parquet(fp, columns=["date"])["date"].cast(pl.Date)
+            dmin, dmax = d.min(), d.max()
+    return names, md.num_rows, dmin, dmax
+
+def _rebuild_window(fp: Path, force: bool) -> tuple[bool, str, tuple | None]:
+    """(ok, status, (start, end)) where the window is None when there is nothing to rebuild."""
+    names, n, dmin, dmax = _footer_info(fp)
+    logger.debug(f"{fp.stem}: {n} records")
+    if "close" not in names:
+        return False, "Missing close column", None
+    if n == 0:
+        return False, "Empty file", None
+    if not force and not _should_rebuild(_read_check_columns(fp, names), force):
+        return True, "Up-to-date", None
+    return True, "", (dmin - timedelta(days=1), dmax + timedelta(days=1))
+
+def _rebuild_plan(root_dir: Path, ticker: str, force: bool) -> tuple[bool, str, tuple | None]:
+    """_rebuild_window for one ticker; a missing or unreadable file becomes a failed status, never an exception."""
+    fp = root_dir / f"{ticker}.parquet"
+    if not fp.exists():
+        return False, "File not found", None
+    try:
+        return _rebuild_window(fp, force)
+    except Exception as e:
+        return False, str(e), None
+
+def _read_check_columns(fp: Path, names: list[str]) -> pl.DataFrame:
+    """Only the columns the rebuild checks look at; dates come from the footer, the rewrite streams from disk."""
+    import polars as pl
+    return pl.read_parquet(fp, columns=[c for c in ("adj_close", "is_ex_div") if c in names])
+
+def _should_rebuild(df: pl.DataFrame, force: bool) -> bool:
+    import polars as pl
     if force: 
         logger.debug("Force rebuild requested")
         return True
     
-    have_adj = "adj_close" in pdf.columns
-    have_exd = "is_ex_div" in pdf.columns
+    have_adj = "adj_close" in df.columns
+    have_exd = "is_ex_div" in df.columns
     
     if not have_adj or not have_exd:
         logger.debug(f"Missing columns: adj_close={have_adj}, is_ex_div={have_exd}")
         return True
     
     # Check for excessive NaN values in adj_close
-    nan_ratio = float(pd.isna(pdf["adj_close"]).mean()) if "adj_close" in pdf.columns else 1.0
+    adj = pl.col("adj_close")
+    nan_ratio = float(df.select((adj.is_null() | adj.is_nan()).mean()).item() or 0.0) if df.height else 1.0
     if nan_ratio > 0.01:
         logger.debug(f"High NaN ratio in adj_close: {nan_ratio:.2%}")
         return True
@@ -82,65 +295,75 @@ def _should_rebuild(pdf: pd.DataFrame, force: bool) -> bool:
     logger.debug("Data quality check passed, no rebuild needed")
     return False
 
-def _process_one(root_dir: Path, ticker: str, force: bool) -> tuple[bool, str]:
+def _process_one(root_dir: Path, ticker: str, force: bool, yahoo: tuple | None = None,
+                 price_dtype: "pl.DataType | None" = None, plan: tuple | None = None,
+                 cache: YahooCache | None = None) -> tuple[bool, str]:
+    import numpy as np, polars as pl
+    # OHLC/adj_close keep the ingest dtype (data.price_dtype); volume stays float64 as in src.data
+    price_dtype = price_dtype or pl.Float64
     fp = root_dir / f"{ticker}.parquet"
     
     if not fp.exists():
         return False, "File not found"
 
     try:
-        # Load existing data
-        df = pl.read_parquet(fp).with_columns(pl.col("date").cast(pl.Date))
-        pdf = df.to_pandas()
-        pdf["date"] = pd.to_datetime(pdf["date"])
-        pdf = pdf.set_index("date")
-        
-        logger.debug(f"Loaded {len(pdf)} records for {ticker}")
-
-        if "close" not in pdf.columns:
-            return False, "Missing close column"
-
-        if not _should_rebuild(pdf, force):
-            return True, "Up-to-date"
+        # Footer stats + the adj_close/is_ex_div columns decide whether to rebuild (main precomputes it)
+        ok, status, window = plan if plan is not None else _rebuild_window(fp, force)
+        if window is None:
+            return ok, status
 
         # Fetch Yahoo data for adjustment factors
-        start = (pdf.index.min() - pd.Timedelta(days=1)).date()
-        end   = (pdf.index.max() + pd.Timedelta(days=1)).date()
+        start, end = window
 
-        yh, div = _yahoo_series(ticker, start=start, end=end)
+        # Prefetched payloads come from _yahoo_batch over a wider window; the left join trims them
+        yh, div = yahoo if yahoo is not None else _yahoo_series(ticker, start=start, end=end, cache=cache)
         
-        # Calculate adjustment factor
-        factor = (yh["AdjClose"] / yh["Close"]).replace([np.inf, -np.inf], np.nan).dropna()
-        factor = factor.to_frame("factor").sort_index()
-        logger.debug(f"Calculated adjustment factors for {len(factor)} dates")
-
-        # Apply adjustments
-        aligned = pdf.join(factor, how="left")
-        aligned["factor"] = aligned["factor"].ffill()
-        aligned["adj_close"] = aligned["close"] * aligned["factor"]
+        # Calculate adjustment factor (non-finite ratios dropped, as with inf→NaN→dropna)
+        factor = (
+            pl.from_pandas(yh.rename_axis("date").reset_index())
+            .lazy()
+            .select(
+                pl.col("date").cast(pl.Date),
+                (pl.col("AdjClose") / pl.col("Close")).alias("factor"),
+            )
+            .filter(pl.col("factor").is_finite())
+        )
 
         # Mark ex-dividend dates
-        is_ex = pd.Series(False, index=aligned.index)
-        if div is not None and len(div) > 0:
-            ex_dates = set(pd.to_datetime(div.index).normalize())
-            is_ex = aligned.index.normalize().isin(ex_dates)
-            logger.debug(f"Marked {is_ex.sum()} ex-dividend dates for {ticker}")
-        aligned["is_ex_div"] = is_ex.astype(bool)
-
-        # Prepare output
-        keep = [c for c in ["open","high","low","close","volume"] if c in aligned.columns]
-        out = pd.DataFrame(index=aligned.index)
-        out["date"] = out.index.date
-        for c in keep:
-            out[c] = aligned[c].astype(float)
-        out["adj_close"] = aligned["adj_close"].astype(float)
-        out["is_ex_div"] = aligned["is_ex_div"].astype(bool)
-
-        # Write back to parquet
-        pl.from_pandas(out.reset_index(drop=True)).write_parquet(fp)
-        
-        adj_count = (~pd.isna(out["adj_close"])).sum()
-        ex_div_count = out["is_ex_div"].sum()
+        div_days = div.index.values.astype("datetime64[D]") if div is not None else np.empty(0, dtype="datetime64[D]")
+        ex_days = pl.Series("ex_days", np.unique(div_days)).cast(pl.Date)
+
+        # read → join factor → ffill → adjust → flag ex-div → write, as one streamed plan.
+        # Sink to a temp file and swap it in, so the plan never reads a half-written source.
+        keep = [c for c in ["open","high","low","close","volume"] if c in pl.read_parquet_schema(fp)]
+        plan = (
+            pl.scan_parquet(fp)
+            .with_columns(pl.col("date").cast(pl.Date))
+            .join(factor, on="date", how="left")
+            .sort("date")
+            .with_columns(pl.col("factor").forward_fill())
+            .select(
+                pl.col("date"),
+                *[pl.col(c).cast(pl.Float64 if c == "volume" else price_dtype) for c in keep],
+                (pl.col("close") * pl.col("factor")).cast(price_dtype).alias("adj_close"),
+                pl.col("date").is_in(ex_days.implode()).alias("is_ex_div"),
+            )
+        )
+        tmp = fp.with_suffix(".tmp.parquet")
+        try:
+            plan.sink_parquet(tmp, **_PARQUET_OPTS)
+        except Exception as e:
+            # Older polars streaming engines cannot sink every operator (e.g. forward_fill)
+            logger.debug(f"sink_parquet unavailable for {ticker}, collecting instead: {e}")
+            plan.collect().write_parquet(tmp, **_PARQUET_OPTS)
+        os.replace(tmp, fp)
+
+        counts = pl.scan_parquet(fp).select(
+            pl.col("adj_close").is_not_null().sum().alias("adj"),
+            pl.col("is_ex_div").sum().alias("exd"),
+        ).collect()
+        adj_count, ex_div_count = int(counts["adj"][0]), int(counts["exd"][0])
+        logger.debug(f"Marked {ex_div_count} ex-dividend dates for {ticker}")
         
         return True, f"Updated ({adj_count} adj, {ex_div_count} ex-div)"
         
@@ -151,6 +374,7 @@ def main():
     ap = argparse.ArgumentParser(description="Adjust ETF prices with dividends and splits")
     ap.add_argument("--config", default="config/params.yaml", help="Configuration file path")
     ap.add_argument("--force", action="store_true", help="Force rebuild even if data exists")
+    ap.add_argument("--workers", type=int, default=8, help="Number of tickers processed concurrently")
     ap.add_argument("--verbose", "-v", action="store_true", help="Enable debug logging")
     args = ap.parse_args()
 
@@ -167,6 +391,11 @@ def main():
         root_dir = Path(params["data"].get("root_dir_ibkr" if src=="ibkr" else "root_dir_yahoo"))
 
         logger.info(f"Data source: {src}, root: {root_dir}")
+        from src.data import _price_dtype
+        price_dtype = _price_dtype(params)
+        cache = YahooCache.from_params(params)
+        if cache is not None and (pruned := cache.prune()):
+            logger.debug(f"Pruned {pruned} expired Yahoo cache files from {cache.root}")
         
         if not root_dir.exists():
             logger.error(f"Root directory does not exist: {root_dir}")
@@ -182,14 +411,37 @@ def main():
         success_count = 0
         failed_tickers = []
 
-        for i, ticker in enumerate(tickers, start=1):
-            success, status = _process_one(root_dir, ticker, args.force)
-            logger.info(f"[{i}/{len(tickers)}] {ticker}: {status}")
-            
-            if success:
-                success_count += 1
-            else:
-                failed_tickers.append(ticker)
+        # Single Yahoo round-trip over the union of all windows that need rebuilding;
+        # a corrupt/truncated file only fails its own ticker
+        plans = {t: _rebuild_plan(root_dir, t, args.force) for t in tickers}
+        ranges = {t: p[2] for t, p in plans.items() if p[2] is not None}
+        prefetched = {}
+        if ranges:
+            try:
+                prefetched = _yahoo_batch(list(ranges), min(r[0] for r in ranges.values()), max(r[1] for r in ranges.values()), cache)
+            except Exception as e:
+                logger.warning(f"Batch download failed, falling back to per-ticker requests: {e}")
+
+        # I/O-bound (Yahoo HTTPS + parquet), so threads are enough; _process_one only takes
+        # picklable args, so ProcessPoolExecutor is a drop-in swap if CPU work ever dominates.
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as ex:
+            futures = {ex.submit(_process_one, root_dir, t, args.force, prefetched.get(t), price_dtype, plans[t], cache): t for t in tickers}
+            for i, fut in enumerate(as_completed(futures), start=1):
+                ticker = futures[fut]
+                success, status = fut.result()
+                logger.info(f"[{i}/{len(tickers)}] {ticker}: {status}")
+
+                if success:
+                    success_count += 1
+                else:
+                    failed_tickers.append(ticker)
+
+        # Consolidated copy of the universe so readers scan one file instead of N
+        try:
+            from src.data import write_price_master
+            write_price_master(root_dir, tickers)
+        except Exception as e:
+            logger.warning(f"Could not write price master: {e}")
 
         # Summary
         elapsed = datetime.now() - start_time
@@ -1,13 +1,24 @@
 #!/usr/bin/env python3
 from __future__ import annotations
+import os
+
+# Pools de threads dimensionnés avant l'import de polars/numpy (sans effet une fois importés):
+# polars sur la moitié des cœurs, BLAS/OpenMP mono-thread (le parallélisme est au niveau des paires)
+_NCORES = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+os.environ.setdefault("POLARS_MAX_THREADS", str(max(1, _NCORES // 2)))
+for _v in ("OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "OMP_NUM_THREADS"):
+    os.environ.setdefault(_v, "1")
+
 from pathlib import Path
 from datetime import datetime
 import argparse, pandas as pd, polars as pl, numpy as np
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from src.config import load_params
 from src.universe import load_universe
-from src.data import ensure_universe, get_price_series, _root_dir_for_source
+from src.data import ensure_universe, get_price_series, load_price_series_many, _root_dir_for_source
 from src.pairs import all_pairs_from_universe, score_pairs
+from src.stats import pair_betas, pair_zscore
 from src.quality import assert_provenance, assert_price_series_ok, assert_pairs_scored_schema, write_qa_log
 
 # Set up logging
@@ -20,18 +31,86 @@ logger = logging.getLogger(__name__)
 def _expected_prov(source: str):
     return {"yahoo","yfinance"} if (source or "yahoo").lower()=="yahoo" else "ibkr"
 
-def _coalesce(dfpl: pl.DataFrame) -> pd.DataFrame:
-    cols = ["date","adj_close","close"]
-    if "is_ex_div" in dfpl.columns: cols.append("is_ex_div")
-    pdf = dfpl.select(cols).to_pandas()
-    pdf["date"] = pd.to_datetime(pdf["date"])
-    pdf["px"] = pdf["adj_close"].fillna(pdf["close"])
-    pdf = pdf.set_index("date")
-    return pdf
+def _coalesce(dfpl: pl.DataFrame) -> pl.DataFrame:
+    # px = adj_close sinon close; reste en polars jusqu'à la matrice numpy (une seule sortie d'Arrow)
+    exprs = [pl.col("date").cast(pl.Date), pl.coalesce([pl.col("adj_close"), pl.col("close")]).cast(pl.Float64).alias("px")]
+    if "is_ex_div" in dfpl.columns: exprs.append(pl.col("is_ex_div").cast(pl.Boolean).fill_null(False))
+    return dfpl.select(exprs)
+
+def _ex_div_days(m: pl.DataFrame) -> np.ndarray:
+    if "is_ex_div" not in m.columns:
+        return np.empty(0, dtype="datetime64[D]")
+    return np.unique(m.filter(pl.col("is_ex_div"))["date"].to_numpy().astype("datetime64[D]"))
+
+def _pack_bits(flags: np.ndarray) -> np.ndarray:
+    # 1 bit par ligne dans des mots uint64 little-endian (bit i ↔ ligne i)
+    b = np.packbits(np.asarray(flags, dtype=bool), bitorder="little")
+    return np.concatenate([b, np.zeros(-len(b) % 8, dtype=np.uint8)]).view("<u8")
+
+def _unpack_bits(bits: np.ndarray, n: int) -> np.ndarray:
+    return np.unpackbits(bits.view(np.uint8), count=n, bitorder="little").astype(bool)
+
+def _blocked_after(flags: np.ndarray, after: int) -> np.ndarray:
+    # Jour ex-div + les `after` lignes suivantes: OR des décalages bits<<k, retenue propagée entre mots
+    bits = _pack_bits(flags)
+    out = bits.copy()
+    for k in range(1, max(0, after) + 1):
+        q, rm = divmod(k, 64)
+        if q >= len(bits):
+            break
+        w = np.zeros_like(bits); w[q:] = bits[:len(bits) - q]
+        if rm:
+            carry = np.zeros_like(w); carry[1:] = w[:-1] >> np.uint64(64 - rm)
+            w = (w << np.uint64(rm)) | carry
+        out |= w
+    return _unpack_bits(out, len(flags))
+
+def _write_journal(df: pl.DataFrame, path: Path, fmt: str) -> None:
+    # CSV par défaut (lecteurs externes des journal_*.csv); parquet zstd sur option (exports.journal_format / --format)
+    # écriture dans un .tmp puis os.replace: pas de journal partiel visible par les lecteurs du bundle
+    if fmt in ("parquet","both"):
+        dst = path.with_suffix(".parquet"); tmp = dst.with_name(dst.name + ".tmp")
+        df.write_parquet(tmp, compression="zstd", statistics=True)
+        os.replace(tmp, dst)
+    if fmt in ("csv","both"):
+        dst = path.with_suffix(".csv"); tmp = dst.with_name(dst.name + ".tmp")
+        df.write_csv(tmp, date_format="%Y-%m-%d")
+        os.replace(tmp, dst)
+
+def _pair_keep(a: str, b: str, M: np.ndarray, col: dict, ex_bits: dict, mask_flag: bool, after: int) -> np.ndarray:
+    valid = ~(np.isnan(M[:, col[a]]) | np.isnan(M[:, col[b]]))
+    keep = valid.copy()
+    if mask_flag:
+        # ex-div des deux jambes: un OR sur les bitsets alignés sur `M`, puis restriction aux lignes de la paire
+        combined = _unpack_bits(ex_bits[a] | ex_bits[b], len(M))[valid]
+        keep[valid] = ~_blocked_after(combined, after)
+    return keep
+
+def _write_journal_dataset(outs: dict[str, pl.DataFrame], out_dir: Path) -> None:
+    # toutes les paires dans un seul dataset parquet partitionné par paire (journals/pair=A_B/...)
+    import pyarrow as pa, pyarrow.dataset as ds
+    tables = [o.with_columns(pl.lit(k).alias("pair")).to_arrow() for k, o in outs.items()]
+    if not tables:
+        return
+    ds.write_dataset(pa.concat_tables(tables), out_dir, format="parquet", partitioning=["pair"], partitioning_flavor="hive",
+                     file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+                     existing_data_behavior="delete_matching")
+
+def _export_pair(r, ya: np.ndarray, xb: np.ndarray, beta: float, days: np.ndarray, lb: dict, out_dir: Path, fmt: str = "csv") -> pl.DataFrame:
+    a, b = str(r["a"]), str(r["b"])
+    roll = max(int(lb.get("zscore_days_min",12)), 60) if pd.isna(r.get("half_life",np.nan)) else max(int(lb.get("zscore_days_min",12)), int(round(float(r["half_life"])*float(lb.get("zscore_mult_half_life",3.0)))))
+    beta, spread, z = pair_zscore(ya, xb, roll, beta)
+    # days est en datetime64[D] → pl.Date directement, sans objets date Python
+    out = pl.DataFrame({"date": days, "ya": ya, "xb": xb, "beta": np.full(len(ya), beta), "spread": spread, "z": z}).fill_nan(None)
+    if fmt != "dataset":
+        _write_journal(out, out_dir/f"journal_{a}_{b}", fmt)
+    return out
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--bundle", default=None)
+    ap.add_argument("--workers", type=int, default=8, help="Parallel pair exports")
+    ap.add_argument("--format", choices=["parquet","csv","both","dataset"], default=None, help="Journal format (default: exports.journal_format)")
     ap.add_argument("--verbose", "-v", action="store_true", help="Enable debug logging")
     args = ap.parse_args()
 
@@ -56,22 +135,35 @@ def main():
 
         logger.info(f"Processing {len(tickers)} tickers")
 
-        price_map, meta = {}, {}
-        for i, t in enumerate(tickers, start=1):
-            try:
-                dfpl = get_price_series(root, t).sort("date")
-                assert_price_series_ok(dfpl, t, params.get("quality",{}), qa_log)
-                m = _coalesce(dfpl)
+        price_map, meta, ex_days = {}, {}, {}
+        loaded = load_price_series_many(root, tickers)
+        logger.debug(f"{len(loaded)}/{len(tickers)} tickers loaded in one pass")
+        qual_cfg = params.get("quality",{})
+
+        def _load(t: str) -> pl.DataFrame:
+            dfpl = (loaded[t] if t in loaded else get_price_series(root, t)).sort("date")
+            assert_price_series_ok(dfpl, t, qual_cfg, qa_log)
+            return _coalesce(dfpl)
+
+        # Lecture parquet + conversion par ticker en parallèle (polars/pyarrow libèrent le GIL)
+        with ThreadPoolExecutor(max_workers=max(1, min(32, len(tickers)))) as ex:
+            futs = [ex.submit(_load, t) for t in tickers]
+            for i, (t, fut) in enumerate(zip(tickers, futs), start=1):
+                try:
+                    m = fut.result()
+                except Exception as e:
+                    logger.error(f"[{i}/{len(tickers)}] {t}: Failed - {e}")
+                    continue
                 meta[t] = m
-                price_map[t] = pd.DataFrame({"close": m["px"]})
-                logger.debug(f"[{i}/{len(tickers)}] {t}: {len(m)} records")
-            except Exception as e:
-                logger.error(f"[{i}/{len(tickers)}] {t}: Failed - {e}")
-                continue
+                ex_days[t] = _ex_div_days(m)
+                # score_pairs (statsmodels) travaille en pandas: seule conversion par ticker
+                price_map[t] = pd.DataFrame({"close": m["px"].to_numpy()}, index=pd.DatetimeIndex(m["date"].to_numpy(), name="date"))
+                logger.debug(f"[{i}/{len(tickers)}] {t}: {m.height} records")
 
         logger.info("Scoring pairs...")
         lb = params.get("lookbacks",{})
-        scored = score_pairs(price_map, all_pairs_from_universe(tickers), int(lb.get("corr_days",120)), int(lb.get("coint_days",120)))
+        scored = score_pairs(price_map, all_pairs_from_universe(tickers), int(lb.get("corr_days",120)), int(lb.get("coint_days",120)),
+                             coint_min_corr=params.get("selection",{}).get("coint_prefilter_min_corr"))
         assert_pairs_scored_schema(scored, params.get("quality",{}), qa_log)
         logger.info(f"Scored {len(scored)} pairs")
 
@@ -82,47 +174,49 @@ def main():
         qual = params.get("quality",{})
         mask_flag = bool(qual.get("mask_ex_div", True))
         after = int(qual.get("mask_ex_div_days_after", 1))
+        fmt = (args.format or str(params.get("exports",{}).get("journal_format","csv"))).lower()
 
         top = scored.sort_values("score",ascending=False).head(12)
         logger.info(f"Exporting journals for top {len(top)} pairs")
 
-        for i, (_, r) in enumerate(top.iterrows(), start=1):
+        # Alignement unique en matrice dense date × ticker; une paire = deux vues colonnes + masque NaN, aucun DataFrame avant l'écriture
+        names = list(meta)
+        wide = pl.concat([m.select("date", pl.col("px").alias(t)) for t, m in meta.items()], how="align")
+        M = wide.select(names).to_numpy().astype(np.float64, copy=False)
+        col = {t: i for i, t in enumerate(names)}
+        days = wide["date"].to_numpy().astype("datetime64[D]")
+        ex_bits = {t: _pack_bits(np.isin(days, ex_days[t])) for t in names}
+
+        # top lu une seule fois en dicts (a, b, half_life...) : pas de Series par ligne dans les workers
+        rows = []
+        for i, r in enumerate(top.to_dict("records"), start=1):
             a, b = str(r["a"]), str(r["b"])
-            try:
-                A = meta[a]; B = meta[b]
-                j = pd.concat([A[["px", *([ "is_ex_div"] if "is_ex_div" in A.columns else [])]].rename(columns={"px":"ya"}),
-                               B[["px", *([ "is_ex_div"] if "is_ex_div" in B.columns else [])]].rename(columns={"px":"xb"})],
-                              axis=1, join="inner").dropna(subset=["ya","xb"])
-                
-                if mask_flag:
-                    ma_flag = A["is_ex_div"] if "is_ex_div" in A.columns else pd.Series(False, index=A.index, dtype=bool)
-                    mb_flag = B["is_ex_div"] if "is_ex_div" in B.columns else pd.Series(False, index=B.index, dtype=bool)
-                    ma_flag = ma_flag.reindex(j.index, fill_value=False).astype(bool)
-                    mb_flag = mb_flag.reindex(j.index, fill_value=False).astype(bool)
-                    
-                    # Build mask efficiently without triggering pandas warnings
-                    mask = ~(ma_flag | mb_flag)
-                    
-                    # Apply shifts for additional days after ex-div
-                    for k in range(1, after + 1):
-                        ma_shifted = ma_flag.shift(k, fill_value=False)
-                        mb_shifted = mb_flag.shift(k, fill_value=False)
-                        mask = mask & ~(ma_shifted | mb_shifted)
-                    
-                    j = j.loc[mask]
-                
-                cov = j["ya"].cov(j["xb"]); var = j["xb"].var()
-                beta = (cov/var) if (var and var!=0) else 1.0
-                roll = max(int(lb.get("zscore_days_min",12)), 60) if pd.isna(r.get("half_life",np.nan)) else max(int(lb.get("zscore_days_min",12)), int(round(float(r["half_life"])*float(lb.get("zscore_mult_half_life",3.0)))))
-                spread = j["ya"] - beta*j["xb"]
-                m = spread.rolling(roll).mean(); s = spread.rolling(roll).std(ddof=1)
-                z = (spread - m) / s.replace(0.0, np.nan)
-                out = pd.DataFrame({"date": j.index.date, "ya": j["ya"].astype(float), "xb": j["xb"].astype(float), "beta": float(beta), "spread": spread.astype(float), "z": z.astype(float)})
-                out.to_csv(bundle/"journals"/f"journal_{a}_{b}.csv", index=False)
-                logger.info(f"[{i}/{len(top)}] {a}-{b}: Exported {len(out)} records")
-            except Exception as e:
-                logger.error(f"[{i}/{len(top)}] {a}-{b}: Failed - {e}")
-                continue
+            if a in col and b in col:
+                rows.append(r)
+            else:
+                logger.error(f"[{i}/{len(top)}] {a}-{b}: Failed - série manquante")
+
+        # Betas de toutes les paires en une passe (T × P), puis z + écriture par paire en parallèle
+        ia = [col[str(r["a"])] for r in rows]; ib = [col[str(r["b"])] for r in rows]
+        K = np.column_stack([_pair_keep(str(r["a"]), str(r["b"]), M, col, ex_bits, mask_flag, after) for r in rows]) if rows else np.zeros((len(M), 0), dtype=bool)
+        betas = pair_betas(M[:, ia], M[:, ib], K)
+
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as ex:
+            futs = {
+                ex.submit(_export_pair, r, M[K[:, p], ia[p]], M[K[:, p], ib[p]], float(betas[p]), days[K[:, p]], lb, bundle/"journals", fmt): (str(r["a"]), str(r["b"]))
+                for p, r in enumerate(rows)
+            }
+            outs = {}
+            for i, fut in enumerate(as_completed(futs), start=1):
+                a, b = futs[fut]
+                try:
+                    outs[f"{a}_{b}"] = out = fut.result()
+                    logger.info(f"[{i}/{len(rows)}] {a}-{b}: Exported {len(out)} records")
+                except Exception as e:
+                    logger.error(f"[{i}/{len(rows)}] {a}-{b}: Failed - {e}")
+
+        if fmt == "dataset":
+            _write_journal_dataset(outs, bundle/"journals")
 
         elapsed = datetime.now() - start_time
         logger.info(f"Completed in {elapsed.total_seconds():.1f}s")
@@ -133,4 +227,4 @@ def main():
         return 1
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    exit(main())
\ No newline at end of file
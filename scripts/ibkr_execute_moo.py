@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 from __future__ import annotations
+from dataclasses import dataclass
 from pathlib import Path
-import argparse, time, yaml, pandas as pd
+import argparse, yaml, pandas as pd
 import logging
 
 # Set up logging
@@ -14,6 +15,39 @@ logger = logging.getLogger(__name__)
 def load_params(p="config/params.yaml")->dict:
     with open(p,"r") as f: return yaml.safe_load(f)
 
+@dataclass(slots=True, frozen=True)
+class ExecCfg:
+    """Config d'exécution IBKR, extraite une seule fois de params.yaml."""
+    host: str
+    port: int
+    client_id: int
+    allow_fractional: bool
+    mode: str
+
+    @classmethod
+    def from_params(cls, params: dict) -> "ExecCfg":
+        ib = params.get("execution", {}).get("ib", {})
+        mode = params.get("trading", {}).get("mode", "paper")
+        return cls(
+            host=ib.get("host", "127.0.0.1"),
+            port=int(ib.get("port_paper", 7497 if mode == "paper" else ib.get("port_live", 7496))),
+            client_id=int(ib.get("client_id", 23)),
+            allow_fractional=bool(ib.get("allow_fractional", True)),
+            mode=mode.upper(),
+        )
+
+_ORDER_COLS = {"a": "string", "b": "string", "verdict": "string", "action": "string",
+               "side_a": "string", "side_b": "string", "qty_a": "float64", "qty_b": "float64"}
+
+def load_orders(path: Path) -> pd.DataFrame:
+    """orders.csv via le parseur CSV pyarrow (multi-thread), limité aux colonnes utilisées par l'exécution."""
+    import pyarrow as pa, pyarrow.csv as pv
+    tbl = pv.read_csv(path, convert_options=pv.ConvertOptions(
+        column_types={c: pa.float64() if t == "float64" else pa.string() for c, t in _ORDER_COLS.items()},
+        include_columns=list(_ORDER_COLS), include_missing_columns=True,
+    ))
+    return tbl.to_pandas()
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--bundle", required=True)
@@ -25,35 +59,30 @@ def main():
         logging.getLogger().setLevel(logging.DEBUG)
 
     params = load_params()
-    mode = params.get("trading", {}).get("mode", "paper").upper()
+    cfg = ExecCfg.from_params(params)
+    mode = cfg.mode
     
     logger.info(f"IBKR execution [{mode}] {'(DRY-RUN)' if args.dry_run else '(LIVE)'} for bundle: {args.bundle}")
 
     try:
-        df = pd.read_csv(Path(args.bundle)/"orders.csv") if (Path(args.bundle)/"orders.csv").exists() else pd.DataFrame()
+        df = load_orders(Path(args.bundle)/"orders.csv") if (Path(args.bundle)/"orders.csv").exists() else pd.DataFrame()
         df = df[df["verdict"].isin(["ENTER","EXIT"])].copy() if not df.empty else df
 
         if df.empty:
             logger.info("No orders to execute")
             return 0
 
-        host = params.get("execution",{}).get("ib",{}).get("host","127.0.0.1")
-        port = int(params.get("execution",{}).get("ib",{}).get(
-            "port_paper", 7497 if params.get("trading",{}).get("mode","paper")=="paper" else params.get("execution",{}).get("ib",{}).get("port_live",7496)
-        ))
-        client_id = int(params.get("execution",{}).get("ib",{}).get("client_id", 23))
-        allow_fractional = bool(params.get("execution",{}).get("ib",{}).get("allow_fractional", True))
-
-        logger.info(f"IBKR connection: {host}:{port} (client_id={client_id})")
+        logger.info(f"IBKR connection: {cfg.host}:{cfg.port} (client_id={cfg.client_id})")
         logger.info(f"Loaded {len(df)} orders for execution")
 
+        # Types fixés une fois pour toutes; les boucles itèrent sur des tuples nommés (pas d'iterrows)
+        df = df.astype({"a": str, "b": str, "side_a": str, "side_b": str, "qty_a": "float64", "qty_b": "float64"})
+        orders = list(df.itertuples(index=False, name="Order"))
+
         if args.dry_run:
             logger.info("DRY-RUN mode - orders will NOT be executed")
-            for i, r in enumerate(df.iterrows(), start=1):
-                _, row = r
-                a, b = str(row["a"]), str(row["b"])
-                sa, sb = str(row["side_a"]), str(row["side_b"])
-                qa, qb = float(row["qty_a"]), float(row["qty_b"])
+            for i, r in enumerate(orders, start=1):
+                a, b, sa, sb, qa, qb = r.a, r.b, r.side_a, r.side_b, r.qty_a, r.qty_b
                 
                 # For CLOSE orders, show that we would check positions
                 order_info = []
@@ -67,7 +96,7 @@ def main():
                 elif sb == "CLOSE_B":
                     order_info.append(f"CLOSE {b} (would check current position)")
                 
-                logger.info(f"[{i}/{len(df)}] {a}-{b}: {row['action']} → {' | '.join(order_info)} @ MOO")
+                logger.info(f"[{i}/{len(df)}] {a}-{b}: {r.action} → {' | '.join(order_info)} @ MOO")
             logger.info("DRY-RUN completed - no orders sent")
             return 0
 
@@ -75,50 +104,57 @@ def main():
         ib = IB()
         
         try:
-            ib.connect(host, port, clientId=client_id)
+            ib.connect(cfg.host, cfg.port, clientId=cfg.client_id)
             logger.info("Connected to IBKR TWS/Gateway")
         except Exception as e:
             logger.error(f"Failed to connect to IBKR: {e}")
             return 1
 
-        def sym(t): return Stock(t, 'SMART', 'USD', primaryExchange='ARCA')
-        
+        # Positions lues une seule fois (ib.positions() renvoie tout le portefeuille) pour les CLOSE_A/CLOSE_B
+        try:
+            pos_map = {p.contract.symbol: p.position for p in ib.positions() if p.contract.secType == 'STK'}
+        except Exception as e:
+            logger.warning(f"Failed to get positions: {e}")
+            pos_map = {}
+
+        # Un contrat par symbole effectivement traité (jambe BUY/SELL, ou CLOSE avec position ouverte),
+        # qualifiés en un seul aller-retour plutôt qu'à chaque ordre
+        traded = {r.a for r in orders if r.side_a in ("BUY_A", "SELL_A") or (r.side_a == "CLOSE_A" and pos_map.get(r.a, 0.0))}
+        traded |= {r.b for r in orders if r.side_b in ("BUY_B", "SELL_B") or (r.side_b == "CLOSE_B" and pos_map.get(r.b, 0.0))}
+        contracts = {t: Stock(t, 'SMART', 'USD', primaryExchange='ARCA') for t in sorted(traded)}
+        try:
+            ib.qualifyContracts(*contracts.values())
+        except Exception as e:
+            logger.warning(f"Contract qualification failed, sending unqualified contracts: {e}")
+
         def get_position_size(ticker):
             """Get current position size for a ticker. Returns 0 if no position."""
-            try:
-                positions = ib.positions()
-                for pos in positions:
-                    if pos.contract.symbol == ticker and pos.contract.secType == 'STK':
-                        return pos.position
-                return 0.0
-            except Exception as e:
-                logger.warning(f"Failed to get position for {ticker}: {e}")
-                return 0.0
+            return pos_map.get(ticker, 0.0)
         
         orders_sent = 0
-        for i, (_, r) in enumerate(df.iterrows(), start=1):
+        for i, r in enumerate(orders, start=1):
+            a, b = r.a, r.b
             try:
-                a,b = str(r["a"]), str(r["b"])
-                qa,qb = float(r["qty_a"]), float(r["qty_b"])
-                if not allow_fractional:
+                qa,qb = r.qty_a, r.qty_b
+                if not cfg.allow_fractional:
                     qa,qb = int(round(qa)), int(round(qb))
-                sa,sb = str(r["side_a"]), str(r["side_b"])
+                sa,sb = r.side_a, r.side_b
 
                 orders_this_pair = 0
                 if sa in ("BUY_A","SELL_A"):
-                    ib.placeOrder(sym(a), MarketOrder("BUY" if sa=="BUY_A" else "SELL", qa, tif='OPG'))
+                    ib.placeOrder(contracts[a], MarketOrder("BUY" if sa=="BUY_A" else "SELL", qa, tif='OPG'))
                     orders_this_pair += 1
                 if sb in ("BUY_B","SELL_B"):
-                    ib.placeOrder(sym(b), MarketOrder("BUY" if sb=="BUY_B" else "SELL", qb, tif='OPG'))
+                    ib.placeOrder(contracts[b], MarketOrder("BUY" if sb=="BUY_B" else "SELL", qb, tif='OPG'))
                     orders_this_pair += 1
                 if sa=="CLOSE_A":
                     current_pos_a = get_position_size(a)
                     if current_pos_a != 0:
                         close_side = "SELL" if current_pos_a > 0 else "BUY"
                         close_qty = abs(current_pos_a)
-                        if not allow_fractional:
+                        if not cfg.allow_fractional:
                             close_qty = int(round(close_qty))
-                        ib.placeOrder(sym(a), MarketOrder(close_side, close_qty, tif='OPG'))
+                        ib.placeOrder(contracts[a], MarketOrder(close_side, close_qty, tif='OPG'))
                         orders_this_pair += 1
                         logger.info(f"CLOSE_A for {a}: {close_side} {close_qty} (current position: {current_pos_a})")
                     else:
@@ -129,9 +165,9 @@ def main():
                     if current_pos_b != 0:
                         close_side = "SELL" if current_pos_b > 0 else "BUY"
                         close_qty = abs(current_pos_b)
-                        if not allow_fractional:
+                        if not cfg.allow_fractional:
                             close_qty = int(round(close_qty))
-                        ib.placeOrder(sym(b), MarketOrder(close_side, close_qty, tif='OPG'))
+                        ib.placeOrder(contracts[b], MarketOrder(close_side, close_qty, tif='OPG'))
                         orders_this_pair += 1
                         logger.info(f"CLOSE_B for {b}: {close_side} {close_qty} (current position: {current_pos_b})")
                     else:
@@ -139,7 +175,7 @@ def main():
 
                 orders_sent += orders_this_pair
                 logger.info(f"[{i}/{len(df)}] {a}-{b}: Sent {orders_this_pair} orders [{mode}]")
-                time.sleep(0.05)
+                ib.sleep(0.05)  # laisse la boucle ib_insync traiter les accusés pendant la pause
 
             except Exception as e:
                 logger.error(f"[{i}/{len(df)}] {a}-{b}: Failed to place orders - {e}")
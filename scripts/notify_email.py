@@ -3,7 +3,10 @@ from __future__ import annotations
 from pathlib import Path
 from datetime import datetime, timezone
 import argparse
+import re
+import numpy as np
 import pandas as pd
+import polars as pl
 import logging
 from src.config import load_params
 
@@ -18,10 +21,16 @@ logger = logging.getLogger(__name__)
 from src.notify_email import load_email_config, send_email
 
 
+# Jetons NA par défaut de pd.read_csv (les CSV du bundle écrivent "None"/"" pour les valeurs manquantes)
+_NA_TOKENS = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+              "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"]
+
+
 def _safe_csv(p: Path) -> pd.DataFrame:
+    # parseur CSV polars (multi-thread, sans objets Python par cellule), puis pandas pour le rendu
     try:
         if p.exists():
-            return pd.read_csv(p)
+            return pl.read_csv(p, null_values=_NA_TOKENS, infer_schema_length=None).to_pandas()
     except Exception:
         pass
     return pd.DataFrame()
@@ -30,12 +39,13 @@ def _safe_csv(p: Path) -> pd.DataFrame:
 def _get_market_context() -> dict:
     """Contexte de marché pour l'email"""
     now = datetime.now(timezone.utc)
-    market_hours = 9.5 <= now.astimezone().hour <= 16  # Approximation US market
+    local = now.astimezone()  # fuseau local résolu une seule fois
+    market_hours = 9.5 <= local.hour <= 16  # Approximation US market
     
     return {
-        "timestamp": now.astimezone().strftime('%Y-%m-%d %H:%M %Z'),
+        "timestamp": local.strftime('%Y-%m-%d %H:%M %Z'),
         "market_open": market_hours,
-        "day_of_week": now.astimezone().strftime('%A'),
+        "day_of_week": local.strftime('%A'),
         "is_weekend": now.weekday() >= 5
     }
 
@@ -294,31 +304,32 @@ def _format_number(value: float, decimals: int = 2) -> str:
     return f"{value:,.{decimals}f}"
 
 
+# état → (classe, icône, message); messages formatés avec n_orders / day
+_ALERT_STATES = {
+    "weekend": ("alert-warning", "⏰", "Weekend - Pas de trading prévu"),
+    "orders": ("alert-success", "🎯", "{n_orders} ordre(s) prêt(s) pour l'ouverture"),
+    "default": ("alert-info", "ℹ️", "Analyse complétée pour {day}"),
+}
+_MODE_BADGE = {"LIVE": "badge-live"}
+
+
 def _generate_summary_section(dec: pd.DataFrame, orders: pd.DataFrame, context: dict) -> str:
     """Section résumé sophistiquée"""
-    n_enter = int((dec["verdict"] == "ENTER").sum()) if "verdict" in dec.columns else 0
-    n_exit = int((dec["verdict"] == "EXIT").sum()) if "verdict" in dec.columns else 0
-    n_hold = int((dec["verdict"] == "HOLD").sum()) if "verdict" in dec.columns else 0
+    # Un seul passage de hachage sur la colonne verdict
+    counts = dec["verdict"].value_counts() if "verdict" in dec.columns else pd.Series(dtype=int)
+    n_enter, n_exit, n_hold = (int(counts.get(v, 0)) for v in ("ENTER", "EXIT", "HOLD"))
     n_orders = len(orders)
 
-    # Calcul notionnel total si disponible
+    # Calcul notionnel total si disponible (tableaux float64 contigus; NaN ignorés comme pandas .sum())
     total_notional = 0
     if not orders.empty and "qty_a" in orders.columns and "price_a" in orders.columns:
-        total_notional = (orders["qty_a"] * orders["price_a"] + orders["qty_b"] * orders["price_b"]).sum()
+        f = lambda c: orders[c].to_numpy(dtype=float)
+        total_notional = float(np.nansum(f("qty_a") * f("price_a") + f("qty_b") * f("price_b")))
 
     # Alert basée sur le contexte
-    alert_class = "alert-info"
-    alert_icon = "ℹ️"
-    alert_msg = f"Analyse complétée pour {context['day_of_week']}"
-    
-    if context["is_weekend"]:
-        alert_class = "alert-warning"
-        alert_icon = "⏰"
-        alert_msg = "Weekend - Pas de trading prévu"
-    elif n_orders > 0:
-        alert_class = "alert-success"
-        alert_icon = "🎯"
-        alert_msg = f"{n_orders} ordre(s) prêt(s) pour l'ouverture"
+    state = "weekend" if context["is_weekend"] else "orders" if n_orders > 0 else "default"
+    alert_class, alert_icon, alert_msg = _ALERT_STATES[state]
+    alert_msg = alert_msg.format(n_orders=n_orders, day=context["day_of_week"])
 
     return f"""
     <div class="alert {alert_class}">
@@ -358,7 +369,7 @@ def _generate_pairs_section(orders: pd.DataFrame) -> str:
     need_cols = {"a", "b", "side_a", "qty_a", "side_b", "qty_b", "action"}
     
     if need_cols.issubset(orders.columns):
-        for _, r in orders.iterrows():
+        for r in orders.to_dict("records"):
             side_a_class = "action-buy" if "BUY" in str(r["side_a"]) else "action-sell"
             side_b_class = "action-buy" if "BUY" in str(r["side_b"]) else "action-sell"
             
@@ -377,6 +388,12 @@ def _generate_pairs_section(orders: pd.DataFrame) -> str:
     return f'<div class="pairs-list">{"".join(cards_html)}</div>'
 
 
+# classe de verdict posée sur la valeur avant to_html (marqueur), puis remontée sur le <td> par une seule passe regex;
+# tout verdict hors ENTER/EXIT (HOLD, inconnu, NaN) garde la classe verdict-hold
+_VERDICT_CLS = {"ENTER": "verdict-enter", "EXIT": "verdict-exit"}
+_VERDICT_TD = re.compile(r"<td>\x00([\w-]+)\x00(.*?)</td>")
+
+
 def _generate_decisions_table(dec: pd.DataFrame) -> str:
     """Table des décisions avec scroll horizontal sur mobile"""
     if dec.empty:
@@ -396,41 +413,28 @@ def _generate_decisions_table(dec: pd.DataFrame) -> str:
     if not display_cols:
         return '<div class="no-data">Données de décisions incomplètes</div>'
 
-    # Construire le HTML de la table
-    headers = "".join([f"<th>{col_labels.get(col, col.replace('_', ' ').title())}</th>" for col in display_cols])
-    
-    rows = []
-    for _, row in dec.iterrows():
-        cells = []
-        for col in display_cols:
-            value = row[col]
-            cell_class = ""
-            
-            if col == "verdict":
-                if value == "ENTER":
-                    cell_class = "verdict-enter"
-                elif value == "EXIT":
-                    cell_class = "verdict-exit"
-                else:
-                    cell_class = "verdict-hold"
-                cells.append(f'<td class="{cell_class}">{value}</td>')
-            elif col in ["z_last", "hl", "beta", "pval"] and pd.notna(value):
-                cells.append(f'<td>{_format_number(float(value), 3)}</td>')
-            elif col == "reason":
-                # Truncate long reasons with tooltip
-                display_value = str(value)[:25] + "..." if len(str(value)) > 25 else str(value)
-                cells.append(f'<td title="{value if pd.notna(value) else ""}">{display_value if pd.notna(value) else "N/A"}</td>')
-            else:
-                cells.append(f'<td>{value if pd.notna(value) else "N/A"}</td>')
-        
-        rows.append(f"<tr>{''.join(cells)}</tr>")
+    # Table émise par DataFrame.to_html (na_rep), verdicts colorés par une seule passe regex
+    view = dec[display_cols].copy()
+    if "reason" in view.columns:
+        # Truncate long reasons with tooltip
+        txt = view["reason"].map(str)
+        short = txt.where(txt.str.len() <= 25, txt.str[:25] + "...")
+        view["reason"] = ('<span title="' + txt + '">' + short + "</span>").where(view["reason"].notna())
+    if "verdict" in view.columns:
+        v = view["verdict"]
+        view["verdict"] = "\x00" + v.map(_VERDICT_CLS).fillna("verdict-hold") + "\x00" + v.map(str).where(v.notna(), "N/A")
+    # numériques formatés avant to_html: les colonnes object (None) échappent aux formatters de pandas
+    fmt3 = lambda x: "N/A" if pd.isna(x) else f"{float(x):,.3f}"
+    for c in ("z_last", "hl", "beta", "pval"):
+        if c in view.columns:
+            view[c] = view[c].map(fmt3)
+    view = view.rename(columns={c: col_labels.get(c, c.replace('_', ' ').title()) for c in display_cols})
+    table = view.to_html(index=False, escape=False, border=0, na_rep="N/A", justify="left")
+    table = _VERDICT_TD.sub(lambda m: f'<td class="{m.group(1)}">{m.group(2)}</td>', table)
 
     return f"""
     <div class="table-container">
-        <table>
-            <thead><tr>{headers}</tr></thead>
-            <tbody>{''.join(rows)}</tbody>
-        </table>
+        {table}
     </div>
     """
 
@@ -472,7 +476,7 @@ def main():
     context = _get_market_context()
     
     # Badge mode
-    mode_badge_class = "badge-live" if mode == "LIVE" else "badge-paper"
+    mode_badge_class = _MODE_BADGE.get(mode, "badge-paper")
     mode_badge = f'<span class="badge {mode_badge_class}">{mode}</span>'
 
     # Construire l'email HTML
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 from pathlib import Path
-import argparse, pandas as pd, yaml, logging
+import argparse, os, numpy as np, pandas as pd, yaml, logging
 from datetime import datetime, timezone
 
 # Set up logging
@@ -11,9 +11,47 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# petits vocabulaires lus directement en catégories: filtres/décomptes sur codes entiers
+_CSV_DTYPES = {c: "category" for c in ("verdict", "action", "side_a", "side_b")}
+# colonnes réellement affichées/contrôlées: le reste (ts, ...) n'est jamais converti en pandas
+_DEC_COLS = ["a","b","verdict","action","reason","z_last","hl","beta","pval"]
+_ORD_COLS = ["a","b","verdict","side_a","qty_a","side_b","qty_b","price_a","price_b"]
+
 def load_params(p="config/params.yaml")->dict:
     with open(p,"r") as f: return yaml.safe_load(f)
 
+def _read_bundle_csv(path: Path, cols: list[str], label: str) -> pd.DataFrame:
+    # un seul stat: fichier absent ou vide (0 octet) → frame vide sans ouvrir le fichier
+    try:
+        size = os.stat(path).st_size
+    except FileNotFoundError:
+        logger.warning(f"{label} file not found: {path}")
+        return pd.DataFrame()
+    if size == 0:
+        logger.warning(f"{label} file is empty: {path}")
+        return pd.DataFrame()
+    # parseur CSV pyarrow (C++ multi-thread), une seule lecture: le schéma de la table sert de contrôle d'en-tête;
+    # vocabulaires en dictionnaire → Categorical côté pandas
+    import pyarrow as pa, pyarrow.csv as pv
+    try:
+        tbl = pv.read_csv(path, convert_options=pv.ConvertOptions(
+            column_types={c: pa.dictionary(pa.int32(), pa.string()) for c in _CSV_DTYPES}, strings_can_be_null=True,
+        ))
+    except pa.ArrowInvalid:
+        # sans en-tête (ex. "\n" de pd.DataFrame().to_csv un jour sans ordres) → vide; toute autre erreur remonte
+        if path.read_bytes().strip():
+            raise
+        logger.warning(f"{label} file has no header: {path}")
+        return pd.DataFrame()
+    header = tbl.column_names
+    if "verdict" not in header:
+        # bundle mal formé/renommé: le garde-fou pré-ouverture doit échouer, pas conclure "rien à faire"
+        raise RuntimeError(f"{path.name}: 'verdict' column missing (header: {header})")
+    missing = [c for c in cols if c not in header]
+    if missing:
+        logger.warning(f"{path.name}: missing columns {missing}")
+    return tbl.select([c for c in cols if c in header]).to_pandas()
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--bundle", required=True)
@@ -30,28 +68,24 @@ def main():
     ords= bdir/"orders.csv"
     
     # Load and validate files
-    if not dec.exists():
-        logger.warning(f"Decisions file not found: {dec}")
-        D = pd.DataFrame()
-    else:
-        D = pd.read_csv(dec)
+    try:
+        D = _read_bundle_csv(dec, _DEC_COLS, "Decisions")
         logger.debug(f"Loaded {len(D)} decisions from {dec}")
-    
-    if not ords.exists():
-        logger.warning(f"Orders file not found: {ords}")
-        O = pd.DataFrame()
-    else:
-        O = pd.read_csv(ords)
+        O = _read_bundle_csv(ords, _ORD_COLS, "Orders")
         logger.debug(f"Loaded {len(O)} orders from {ords}")
+    except Exception as e:
+        logger.error(f"Pre-market check failed: {e}")
+        return 1
 
     # Filter relevant data
     D = D[D["verdict"].isin(["ENTER","EXIT","HOLD"])] if not D.empty else D
     O = O[O["verdict"].isin(["ENTER","EXIT"])] if not O.empty else O
 
     # Summary counts
-    enter_count = len(D[D["verdict"] == "ENTER"]) if not D.empty else 0
-    exit_count = len(D[D["verdict"] == "EXIT"]) if not D.empty else 0
-    hold_count = len(D[D["verdict"] == "HOLD"]) if not D.empty else 0
+    counts = D["verdict"].value_counts() if not D.empty else pd.Series(dtype=int)
+    enter_count = int(counts.get("ENTER", 0))
+    exit_count = int(counts.get("EXIT", 0))
+    hold_count = int(counts.get("HOLD", 0))
     order_count = len(O)
 
     logger.info(f"Summary: {enter_count} ENTER, {exit_count} EXIT, {hold_count} HOLD decisions → {order_count} orders")
@@ -66,17 +100,26 @@ def main():
     if D.empty:
         print("  No decisions to review")
     else:
-        print(D[["a","b","verdict","action","reason","z_last","hl","beta","pval"]].to_string(index=False))
+        print(D[[c for c in _DEC_COLS if c in D.columns]].to_string(index=False))
     
     print(f"\nORDERS TO EXECUTE ({len(O)} total):")
     if O.empty:
         print("  No orders to execute")
         logger.info("All clear - no orders to execute")
     else:
-        print(O[["a","b","side_a","qty_a","side_b","qty_b"]].to_string(index=False))
+        print(O[[c for c in ["a","b","side_a","qty_a","side_b","qty_b"] if c in O.columns]].to_string(index=False))
         
         # Risk warnings
-        total_notional = (O["qty_a"] * O["price_a"] + O["qty_b"] * O["price_b"]).sum() if "price_a" in O.columns else 0
+        total_notional = 0
+        notional_cols = ["qty_a","price_a","qty_b","price_b"]
+        if set(notional_cols) <= set(O.columns):
+            # un seul tableau float64 contigu: notionnel par ordre + détection des qty/prix manquants
+            q = O[notional_cols].to_numpy(dtype=np.float64, na_value=np.nan)
+            legs = q[:, 0] * q[:, 1] + q[:, 2] * q[:, 3]
+            n_nan = int(np.isnan(legs).sum())
+            if n_nan:
+                logger.warning(f"{n_nan} order(s) with missing qty/price excluded from notional")
+            total_notional = float(np.nansum(legs))
         if total_notional > 0:
             logger.info(f"Total notional to trade: ${total_notional:,.0f}")
         
@@ -2,16 +2,21 @@
 from __future__ import annotations
 from pathlib import Path
 from typing import Optional, List, Dict
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import argparse
+import os
 import polars as pl
 import pandas as pd
-from tabulate import tabulate
+import numpy as np
 
 from src.config import load_params
 from src.universe import load_universe
-from src.data import ensure_universe, get_price_series
+from src.data import ensure_universe, get_price_series, load_price_series_many, _price_dtype
 from src.pairs import all_pairs_from_universe, score_pairs
-from src.backtest import merge_close_series, simulate_pair
+from src.backtest import close_frame, merge_close_series, simulate_pair
 from src.profile import merged_risk
+from src.provenance import write_json_atomic
 from src.quality import assert_provenance, assert_price_series_ok, assert_pairs_scored_schema
 
 def _bundle_dir(params: dict) -> Path:
@@ -32,6 +37,12 @@ def _expected_prov(params: dict):
     src = params.get("data", {}).get("source", "yahoo").lower()
     return {"yahoo", "yfinance"} if src == "yahoo" else "ibkr"
 
+def _write_csv_atomic(df: pd.DataFrame, path: Path, **kw) -> None:
+    # écrit à côté puis renomme: un lecteur ne voit jamais de journal à moitié écrit
+    tmp = path.with_name(path.name + ".tmp")
+    df.to_csv(tmp, **kw)
+    os.replace(tmp, path)
+
 def _detect_hl_col(scored: pd.DataFrame) -> Optional[str]:
     for c in ["half_life", "half_life_days", "hl"]:
         if c in scored.columns:
@@ -47,30 +58,78 @@ def _selection_thresholds(params: dict) -> Dict[str, float]:
         "max_hl": float(sel.get("max_half_life_days", sf.get("half_life_max_days", 20.0))),
     }
 
-def _select_pairs(scored: pd.DataFrame, params: dict, topk: int) -> pd.DataFrame:
+def _select_pairs(scored: pd.DataFrame, params: dict, topk: int, hlcol: Optional[str]) -> pd.DataFrame:
     th = _selection_thresholds(params)
     need = {"a", "b", "corr", "pval", "score"}
     miss = need - set(scored.columns)
     if miss:
         raise ValueError(f"pairs_scored missing columns: {miss}")
     flt = (scored["corr"] >= th["min_corr"]) & (scored["pval"] <= th["pval_coint"])
-    hlcol = _detect_hl_col(scored)
     if hlcol is not None:
         flt &= (scored[hlcol] <= th["max_hl"])
-    return scored.loc[flt].sort_values("score", ascending=False).head(topk).copy()
+    # top-k par tas (O(N log k)) plutôt que tri complet; score jamais NaN après le filtre pval
+    return scored.loc[flt].nlargest(topk, "score").copy()
 
-def _z_window(row: pd.Series, params: dict) -> int:
-    lb = params.get("lookbacks", {})
-    zmin = int(lb.get("zscore_days_min", 12))
-    mult = float(lb.get("zscore_mult_half_life", 3.0))
-    hlcol = _detect_hl_col(pd.DataFrame([row]))
-    hl = float(row.get(hlcol, float("nan"))) if hlcol else float("nan")
+def _z_window(hl: float, zmin: int, mult: float) -> int:
     return max(zmin, int(round(mult * hl))) if pd.notna(hl) and hl > 0 else max(zmin, 60)
 
 def _count_entries(sig: pd.Series) -> int:
-    s = sig.fillna(0).astype(int)
-    sh = s.shift(1).fillna(0).astype(int)
-    return int(((sh == 0) & (s != 0)).sum())
+    s = sig.fillna(0).to_numpy(dtype=np.int8)
+    if s.size == 0:
+        return 0
+    # une entrée = passage de 0 à non-nul (la première barre compte si déjà en position)
+    return int(s[0] != 0) + int(np.count_nonzero((s[:-1] == 0) & (s[1:] != 0)))
+
+@dataclass(slots=True, frozen=True)
+class SimConfig:
+    """Paramètres de simulation communs à toutes les paires, extraits une seule fois de params.yaml."""
+    entry_z: float
+    exit_z: float
+    stop_z: float
+    risk_pct: float
+    capital: float
+    costs_bp: int
+    cool_off_bars: int
+    min_bars_between_entries: int
+    notional_per_trade: float
+    require_cross: bool
+    slope_confirm: bool
+    slope_lookback: int
+
+    @classmethod
+    def from_params(cls, params: dict, risk: dict) -> "SimConfig":
+        thr = params.get("thresholds", {})
+        logic = params.get("decision", {})
+        return cls(
+            entry_z=float(thr.get("entry_z", 2.2)),
+            exit_z=float(thr.get("exit_z", 0.5)),
+            stop_z=float(thr.get("stop_z", 3.0)),
+            risk_pct=float(risk.get("per_trade_pct", 0.0) or 0.0),
+            capital=float(risk.get("capital", 100000)),
+            costs_bp=int(params.get("costs", {}).get("slippage_bp", 2)),
+            cool_off_bars=int(logic.get("cool_off_bars", 5)),
+            min_bars_between_entries=int(logic.get("min_bars_between_entries", 10)),
+            notional_per_trade=float(risk.get("notional_per_trade", 0.0) or 0.0),
+            require_cross=bool(logic.get("entry_require_cross", True)),
+            slope_confirm=bool(logic.get("entry_slope_confirm", True)),
+            slope_lookback=int(logic.get("slope_lookback", 3)),
+        )
+
+def _simulate_one(job: tuple) -> tuple:
+    # exécuté dans un processus fils: simulate_pair est une boucle Python par barre (GIL)
+    a, b, df, zwin, cfg = job
+    total, journal = simulate_pair(
+        df, cfg.entry_z, cfg.exit_z, cfg.stop_z, int(zwin), cfg.risk_pct,
+        capital=cfg.capital,
+        costs_bp=cfg.costs_bp,
+        cool_off_bars=cfg.cool_off_bars,
+        min_bars_between_entries=cfg.min_bars_between_entries,
+        notional_per_trade=cfg.notional_per_trade,
+        require_cross=cfg.require_cross,
+        slope_confirm=cfg.slope_confirm,
+        slope_lookback=cfg.slope_lookback,
+    )
+    return a, b, float(total), journal
 
 def _extract_key_params(params: dict) -> dict:
     """Extract key parameters for logging/tracking"""
@@ -95,18 +154,21 @@ def _extract_key_params(params: dict) -> dict:
 
 def _save_run_params(bundle_dir: Path, params: dict, script_name: str) -> None:
     """Save key parameters to bundle directory"""
-    import json
     key_params = _extract_key_params(params)
     key_params["_meta"]["script"] = script_name
     
     bundle_dir.mkdir(parents=True, exist_ok=True)
     params_file = bundle_dir / "run_params.json"
-    with open(params_file, 'w') as f:
-        json.dump(key_params, f, indent=2, default=str)
+    # un seul dumps + écriture atomique (json.dump indenté écrit morceau par morceau)
+    write_json_atomic(params_file, key_params, indent=2, default=str)
     
     print(f"Parameters saved to: {params_file}")
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=None, help="Parallel pair simulations (default: usable cores)")
+    args = ap.parse_args()
+
     params = load_params()
     risk = merged_risk(params)
     tickers = load_universe()
@@ -121,26 +183,34 @@ def main():
         qa_log,
     )
 
-    price_map = {}
+    price_map, frames = {}, {}
+    # data.price_dtype: float32 → price_map reste en float32 (scoring), sinon float64 comme avant
+    px_dtype = np.float32 if _price_dtype(params) == pl.Float32 else np.float64
+    # univers lu en une passe (master ou scan multi-fichiers), repli fichier par fichier sinon
+    loaded = load_price_series_many(root, tickers)
     for t in tickers:
-        dfpl = get_price_series(root, t).sort("date")
+        dfpl = loaded[t].with_columns(pl.col("date").cast(pl.Date)) if t in loaded else get_price_series(root, t)
+        dfpl = frames[t] = dfpl.sort("date")
         assert_price_series_ok(dfpl, t, params.get("quality", {}), qa_log)
-        pdf = dfpl.select(["date", "adj_close", "close"]).to_pandas().set_index("date")
-        s = pdf["adj_close"].fillna(pdf["close"])
-        price_map[t] = pd.DataFrame({"close": s})
+        pdf = dfpl.select(["date", pl.coalesce(["adj_close", "close"]).alias("px")]).to_pandas(use_pyarrow_extension_array=True)
+        idx = pd.DatetimeIndex(pd.to_datetime(pdf["date"]), name="date")
+        price_map[t] = pd.DataFrame({"close": pdf["px"].to_numpy(dtype=px_dtype, na_value=np.nan)}, index=idx)
 
     pairs = all_pairs_from_universe(tickers)
     lb = params.get("lookbacks", {})
-    scored = score_pairs(price_map, pairs, int(lb.get("corr_days", 120)), int(lb.get("coint_days", 120)))
+    scored = score_pairs(price_map, pairs, int(lb.get("corr_days", 120)), int(lb.get("coint_days", 120)),
+                         coint_min_corr=params.get("selection",{}).get("coint_prefilter_min_corr"))
     assert_pairs_scored_schema(scored, params.get("quality", {}), qa_log)
 
     topk = 5
-    top = _select_pairs(scored, params, topk)
+    # colonne demi-vie résolue une fois (top garde les colonnes de scored)
+    hlcol = _detect_hl_col(scored)
+    top = _select_pairs(scored, params, topk, hlcol)
     if top.empty:
         print("(aucune paire après filtres)"); return
 
     print("\nTop paires sélectionnées:\n")
-    print(tabulate(top.head(15), headers="keys", tablefmt="psql", floatfmt=".4f"))
+    print(top.head(15).to_string(index=False, float_format=lambda x: f"{x:.4f}"))
 
     bundle = _bundle_dir(params)
     out_dir = bundle / "backtest"
@@ -150,39 +220,37 @@ def main():
     _save_run_params(out_dir, params, "run_backtest")
 
     rows: List[tuple] = []
-    hlcol = _detect_hl_col(top)
-    thr = params.get("thresholds", {})
+    zmin = int(lb.get("zscore_days_min", 12))
+    zmult = float(lb.get("zscore_mult_half_life", 3.0))
+    cfg = SimConfig.from_params(params, risk)
+    # conversion pandas par ticker faite une seule fois: un ticker revient dans plusieurs paires
+    closes: Dict[str, pd.DataFrame] = {}
+    jobs, meta = [], {}
     for _, r in top.iterrows():
         a, b = str(r["a"]), str(r["b"])
         hl = float(r[hlcol]) if hlcol and pd.notna(r[hlcol]) else float("nan")
-        zwin = _z_window(r, params)
+        zwin = _z_window(hl, zmin, zmult)
 
-        dfa = get_price_series(root, a)
-        dfb = get_price_series(root, b)
-        df = merge_close_series(dfa, dfb)
-        
-        logic = params.get("decision", {})
-        require_cross = bool(logic.get("entry_require_cross", True))
-        slope_confirm = bool(logic.get("entry_slope_confirm", True))
-
-        total, journal = simulate_pair(
-            df,
-            float(thr.get("entry_z", 2.2)),
-            float(thr.get("exit_z", 0.5)),
-            float(thr.get("stop_z", 3.0)),
-            int(zwin),
-            float(risk.get("per_trade_pct", 0.0) or 0.0),
-            capital=float(risk.get("capital", 100000)),
-            costs_bp=int(params.get("costs", {}).get("slippage_bp", 2)),
-            cool_off_bars=int(params.get("decision", {}).get("cool_off_bars", 5)),
-            min_bars_between_entries=int(params.get("decision", {}).get("min_bars_between_entries", 10)),
-            notional_per_trade=float(risk.get("notional_per_trade", 0.0) or 0.0),
-            require_cross=require_cross,
-            slope_confirm=slope_confirm,
-            slope_lookback=int(logic.get("slope_lookback", 3)),
-        )
-        journal.to_csv(out_dir / f"journal_{a}_{b}.csv")
-        rows.append((a, b, hl, zwin, _count_entries(journal["signal"]) if "signal" in journal.columns else 0, float(total)))
+        # séries déjà chargées pour le scoring: pas de relecture parquet par paire
+        for t in (a, b):
+            if t not in closes:
+                closes[t] = close_frame(frames[t])
+        jobs.append((a, b, merge_close_series(closes[a], closes[b]), zwin, cfg))
+        meta[(a, b)] = (hl, zwin)
+
+    # paires indépendantes → un processus par paire; écritures CSV déléguées à un pool de threads
+    writer = ThreadPoolExecutor(max_workers=4)
+    writes = []
+    ncpu = args.workers or (len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1))
+    with ProcessPoolExecutor(max_workers=max(1, min(len(jobs), ncpu))) as ex:
+        for a, b, total, journal in ex.map(_simulate_one, jobs):
+            hl, zwin = meta[(a, b)]
+            writes.append(writer.submit(_write_csv_atomic, journal, out_dir / f"journal_{a}_{b}.csv"))
+            rows.append((a, b, hl, zwin, _count_entries(journal["signal"]) if "signal" in journal.columns else 0, total))
+
+    writer.shutdown(wait=True)
+    for w in writes:
+        w.result()
 
     summary = pd.DataFrame([
         {"pair": f"{a}/{b}", "HL(d)": (f"{hl:.1f}" if pd.notna(hl) else "NA"), "z_win": zwin, "entries": entries, "PnL($)": pnl}
@@ -190,8 +258,8 @@ def main():
     ])
     summary.to_csv(out_dir / "summary.csv", index=False)
 
-    print(f"\nRésumé Top-{len(top)} (z dynamique = 3×HL, min_window={int(lb.get('zscore_days_min', 12))}):\n")
-    print(tabulate(summary, headers="keys", tablefmt="psql"))
+    print(f"\nRésumé Top-{len(top)} (z dynamique = 3×HL, min_window={zmin}):\n")
+    print(summary.to_string(index=False))
 
 if __name__ == "__main__":
     main()
@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 from __future__ import annotations
-import sys, subprocess, shlex, argparse
+import sys, subprocess, shlex, argparse, importlib, logging
 from pathlib import Path
 from datetime import datetime, timezone
 import yaml
@@ -19,10 +19,25 @@ def run(cmd: str) -> int:
     print(f"[run] {cmd}")
     return subprocess.call(shlex.split(cmd))
 
+def run_inproc(script: str, *argv: str) -> int:
+    """Exécute main() d'un script dans le process courant (imports pandas/polars/src partagés)."""
+    print(f"[run:inproc] {script} {' '.join(argv)}".rstrip())
+    mod = importlib.import_module(Path(script).stem)
+    saved = sys.argv
+    sys.argv = [script, *argv]
+    try:
+        rc = mod.main()
+    except SystemExit as e:
+        rc = e.code if isinstance(e.code, int) or e.code is None else 1
+    finally:
+        sys.argv = saved
+    return int(rc or 0)
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("phase", choices=["evening","preopen","summary"])
     ap.add_argument("--day", default=None)
+    ap.add_argument("--isolate", action="store_true", help="Evening: one subprocess per step instead of in-process")
     args = ap.parse_args()
 
     params = load_params()
@@ -31,17 +46,17 @@ def main():
     py = sys.executable
 
     if args.phase == "evening":
-        # 1) Ingestion (fait les 2 sources via params)
-        rc = run(f"{py} scripts/ingest_data.py")
-        if rc != 0: sys.exit(rc)
-        # 2) Ajustement des prix/adjs + ex-div
-        rc = run(f"{py} scripts/adjust_prices.py")
-        if rc != 0: sys.exit(rc)
-        # 3) Décisions + Orders + HTML → bundle
-        rc = run(f"{py} scripts/run_report.py --bundle {bdir}")
-        if rc != 0: sys.exit(rc)
-        # 4) Journaux z-score → bundle
-        rc = run(f"{py} scripts/export_journals.py --bundle {bdir}")
+        # ingestion → ajustements/ex-div → décisions+orders+HTML → journaux z-score
+        steps = [("scripts/ingest_data.py",), ("scripts/adjust_prices.py",),
+                 ("scripts/run_report.py", "--bundle", str(bdir)),
+                 ("scripts/export_journals.py", "--bundle", str(bdir))]
+        if not args.isolate:
+            # un seul process: logging configuré une fois ici, le basicConfig des scripts importés est alors sans effet
+            logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+        rc = 0
+        for script, *argv in steps:
+            rc = run(" ".join([py, script, *argv])) if args.isolate else run_inproc(script, *argv)
+            if rc != 0: sys.exit(rc)
         sys.exit(rc)
 
     if args.phase == "preopen":
@@ -3,13 +3,16 @@ from __future__ import annotations
 from pathlib import Path
 from datetime import datetime, timezone
 from typing import Optional, Dict, List, Tuple
+import io
 import logging
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np, pandas as pd, polars as pl
 from src.config import load_params
 from src.universe import load_universe
-from src.data import ensure_universe, get_price_series, _root_dir_for_source
+from src.data import ensure_universe, get_price_series, load_price_series_many, _root_dir_for_source
 from src.pairs import all_pairs_from_universe, score_pairs
 from src.profile import merged_risk
+from src.provenance import write_json_atomic
 from src.quality import assert_provenance, assert_price_series_ok, assert_pairs_scored_schema, write_qa_log
 from src.decisions import decide_pair
 
@@ -24,13 +27,14 @@ def _expected_prov(source: str):
     return {"yahoo","yfinance"} if (source or "yahoo").lower()=="yahoo" else "ibkr"
 
 def _coalesce_meta(dfpl: pl.DataFrame) -> pd.DataFrame:
-    cols = ["date","adj_close","close"]
-    if "is_ex_div" in dfpl.columns: cols.append("is_ex_div")
-    pdf = dfpl.select(cols).to_pandas()
+    # px coalescé côté polars, handoff Arrow sans copie; px matérialisé en float64 pour numpy/statsmodels
+    exprs = [pl.col("date"), pl.coalesce([pl.col("adj_close"), pl.col("close")]).alias("px")]
+    # flag nul (ex. ligne 0 de repair._compute_is_ex_div) → False, comme export_journals._coalesce
+    if "is_ex_div" in dfpl.columns: exprs.append(pl.col("is_ex_div").cast(pl.Boolean).fill_null(False))
+    pdf = dfpl.select(exprs).to_pandas(use_pyarrow_extension_array=True)
     pdf["date"] = pd.to_datetime(pdf["date"])
-    px = pdf["adj_close"].fillna(pdf["close"])
-    out = pd.DataFrame({"px": px.values}, index=pdf["date"].values)
-    if "is_ex_div" in pdf.columns: out["is_ex_div"] = pdf["is_ex_div"].astype(bool).values
+    out = pd.DataFrame({"px": pdf["px"].to_numpy(dtype=float, na_value=np.nan)}, index=pdf["date"].values)
+    if "is_ex_div" in pdf.columns: out["is_ex_div"] = pdf["is_ex_div"].to_numpy(dtype=bool)
     return out
 
 def _coalesce_close(meta: pd.DataFrame, name: str) -> pd.Series:
@@ -72,13 +76,12 @@ def _extract_key_params(params: dict) -> dict:
 
 def _save_run_params(bundle_dir: Path, params: dict, script_name: str) -> None:
     """Save key parameters to bundle directory"""
-    import json
     key_params = _extract_key_params(params)
     key_params["_meta"]["script"] = script_name
     
     params_file = bundle_dir / "run_params.json"
-    with open(params_file, 'w') as f:
-        json.dump(key_params, f, indent=2, default=str)
+    # un seul dumps + écriture atomique (json.dump indenté écrit morceau par morceau)
+    write_json_atomic(params_file, key_params, indent=2, default=str)
     
     logger.info(f"Parameters saved to: {params_file}")
 
@@ -90,7 +93,7 @@ def _select_pairs(scored: pd.DataFrame, params: dict, topk: int) -> pd.DataFrame
     flt = (scored["corr"]>=th["min_corr"]) & (scored["pval"]<=th["pval"])
     h = _hl_col(scored)
     if h is not None: flt &= (scored[h]<=th["max_hl"])
-    return scored.loc[flt].sort_values("score",ascending=False).head(topk).copy()
+    return scored.loc[flt].nlargest(topk, "score").copy()
 
 def _html_table(df: pd.DataFrame, title: str) -> str:
     style = """
@@ -109,18 +112,18 @@ def _html_table(df: pd.DataFrame, title: str) -> str:
         if "ENTER" in v: return "enter"
         if "EXIT" in v: return "exit"
         return "hold"
-    head = "<thead><tr>"+"".join(f"<th>{c}</th>" for c in df.columns)+"</tr></thead>"
-    body = []
-    for _,r in df.iterrows():
-        t=[]
-        for c in df.columns:
-            v=r[c]
-            if c in ("verdict","action"): t.append(f'<td class="{cls(v)}">{v}</td>')
-            elif isinstance(v,float) and c in ("z_last","hl","beta","pval"): t.append(f"<td>{v:.4f}</td>")
-            elif isinstance(v,float): t.append(f"<td>{v:.2f}</td>")
-            else: t.append(f"<td>{v}</td>")
-        body.append("<tr>"+"".join(t)+"</tr>")
-    table = "<table>"+head+"<tbody>"+"".join(body)+"</tbody></table>"
+    def fmt(c):
+        # formateur choisi une fois par colonne (pas de tests de nom de colonne par cellule)
+        if c in ("verdict","action"): return lambda v: f'<td class="{cls(v)}">{v}</td>'
+        spec = ".4f" if c in ("z_last","hl","beta","pval") else ".2f"
+        return lambda v: f"<td>{v:{spec}}</td>" if isinstance(v,float) else f"<td>{v}</td>"
+    fmts = [fmt(c) for c in df.columns]
+    buf = io.StringIO()
+    buf.write("<table><thead><tr>"+"".join(f"<th>{c}</th>" for c in df.columns)+"</tr></thead><tbody>")
+    for row in df.itertuples(index=False, name=None):
+        buf.write("<tr>"+"".join(f(v) for f, v in zip(fmts, row))+"</tr>")
+    buf.write("</tbody></table>")
+    table = buf.getvalue()
     return f"<!doctype html><html><head><meta charset='utf-8'>{style}</head><body><h2>{title}</h2>{table}</body></html>"
 
 def main():
@@ -146,22 +149,34 @@ def main():
         logger.info(f"Processing {len(tickers)} tickers")
 
         meta, price_map = {}, {}
-        for i, t in enumerate(tickers, start=1):
-            try:
-                dfpl = get_price_series(root, t).sort("date")
-                assert_price_series_ok(dfpl, t, params.get("quality",{}), qa_log)
-                m = _coalesce_meta(dfpl)
+        # univers lu en une passe (master ou scan multi-fichiers), repli fichier par fichier sinon
+        loaded = load_price_series_many(root, tickers)
+        qual_cfg = params.get("quality",{})
+
+        def _load(t: str) -> pd.DataFrame:
+            dfpl = loaded[t].with_columns(pl.col("date").cast(pl.Date)) if t in loaded else get_price_series(root, t)
+            dfpl = dfpl.sort("date")
+            assert_price_series_ok(dfpl, t, qual_cfg, qa_log)
+            return _coalesce_meta(dfpl)
+
+        # QA + conversion par ticker en parallèle (polars/pyarrow libèrent le GIL); résultats dans l'ordre de l'univers
+        with ThreadPoolExecutor(max_workers=max(1, min(16, len(tickers)))) as ex:
+            futs = [ex.submit(_load, t) for t in tickers]
+            for i, (t, fut) in enumerate(zip(tickers, futs), start=1):
+                try:
+                    m = fut.result()
+                except Exception as e:
+                    logger.error(f"[{i}/{len(tickers)}] {t}: Failed - {e}")
+                    continue
                 meta[t] = m
                 price_map[t] = pd.DataFrame({"close": m["px"]})
                 logger.info(f"[{i}/{len(tickers)}] {t}: {len(m)} records")
-            except Exception as e:
-                logger.error(f"[{i}/{len(tickers)}] {t}: Failed - {e}")
-                continue
 
         logger.info("Scoring pairs...")
         pairs = all_pairs_from_universe(tickers)
         lb = params.get("lookbacks",{})
-        scored = score_pairs(price_map, pairs, int(lb.get("corr_days",120)), int(lb.get("coint_days",120)))
+        scored = score_pairs(price_map, pairs, int(lb.get("corr_days",120)), int(lb.get("coint_days",120)),
+                             coint_min_corr=params.get("selection",{}).get("coint_prefilter_min_corr"))
         assert_pairs_scored_schema(scored, params.get("quality",{}), qa_log)
         logger.info(f"Scored {len(scored)} pairs")
 
@@ -173,7 +188,7 @@ def main():
         decisions_dir.mkdir(parents=True, exist_ok=True)
         _save_run_params(decisions_dir, params, "run_report")
 
-        pl.from_pandas(scored).write_parquet(decisions_dir/"pairs_scored.parquet")
+        pl.from_pandas(scored).write_parquet(decisions_dir/"pairs_scored.parquet", compression="zstd", compression_level=3, statistics=True)
 
         topk = int(params.get("exports",{}).get("topk",20))
         cand = _select_pairs(scored, params, topk)
@@ -202,27 +217,26 @@ def main():
         html = _html_table(dec_out, f"Decisions — {source.upper()} / {mode} — {datetime.now().strftime('%Y-%m-%d %H:%M')}")
         (decisions_dir/"decisions.html").write_text(html, encoding="utf-8")
 
-        orders = []
-        for _, r in dec_df.iterrows():
-            if r["verdict"] not in ("ENTER","EXIT"): continue
-            a = str(r["a"]); b = str(r["b"])
-            pa = float(meta[a]["px"].iloc[-1]); pb = float(meta[b]["px"].iloc[-1])
-            beta = float(r.get("beta", 1.0) if pd.notna(r.get("beta", np.nan)) else 1.0)
-            notional = float(risk.get("notional_per_trade", 0.0) or 0.0)
-            if notional<=0 and float(risk.get("per_trade_pct",0.0) or 0.0)>0:
-                notional = float(risk.get("capital",0.0) or 0.0) * float(risk.get("per_trade_pct",0.0))
-            qa = int(max(0, np.floor((notional/2.0)/max(pa,1e-9))))
-            qb = int(max(0, np.floor((notional/2.0)/max(pb,1e-9))))
-            action = str(r["action"])
-            if action == "ShortY_LongX": side_a, side_b = "SELL_A", "BUY_B"
-            elif action == "LongY_ShortX": side_a, side_b = "BUY_A", "SELL_B"
-            else: side_a, side_b = "CLOSE_A", "CLOSE_B"
-            orders.append({
-                "ts": r["ts"], "a": a, "b": b, "verdict": r["verdict"], "action": action, "reason": r["reason"],
-                "price_a": pa, "price_b": pb, "qty_a": qa, "qty_b": qb, "side_a": side_a, "side_b": side_b
-            })
+        # Quantités calculées en un bloc numpy sur toutes les décisions ENTER/EXIT
+        od = dec_df[dec_df["verdict"].isin(["ENTER","EXIT"])]
+        notional = float(risk.get("notional_per_trade", 0.0) or 0.0)
+        if notional<=0 and float(risk.get("per_trade_pct",0.0) or 0.0)>0:
+            notional = float(risk.get("capital",0.0) or 0.0) * float(risk.get("per_trade_pct",0.0))
+        a_arr = od["a"].astype(str).to_numpy(); b_arr = od["b"].astype(str).to_numpy()
+        pa = np.array([meta[t]["px"].iloc[-1] for t in a_arr], dtype=float)
+        pb = np.array([meta[t]["px"].iloc[-1] for t in b_arr], dtype=float)
+        qa = np.fmax(np.floor((notional/2.0) / np.maximum(pa, 1e-9)), 0).astype(np.int64)
+        qb = np.fmax(np.floor((notional/2.0) / np.maximum(pb, 1e-9)), 0).astype(np.int64)
+        action = od["action"].astype(str).to_numpy()
+        side_a = np.select([action == "ShortY_LongX", action == "LongY_ShortX"], ["SELL_A", "BUY_A"], "CLOSE_A")
+        side_b = np.select([action == "ShortY_LongX", action == "LongY_ShortX"], ["BUY_B", "SELL_B"], "CLOSE_B")
+        orders = pd.DataFrame({
+            "ts": od["ts"].to_numpy(), "a": a_arr, "b": b_arr, "verdict": od["verdict"].to_numpy(), "action": action,
+            "reason": od["reason"].to_numpy(), "price_a": pa, "price_b": pb, "qty_a": qa, "qty_b": qb,
+            "side_a": side_a, "side_b": side_b,
+        }) if len(od) else pd.DataFrame()
         
-        pd.DataFrame(orders).to_csv(decisions_dir/"orders.csv", index=False)
+        orders.to_csv(decisions_dir/"orders.csv", index=False)
         
         elapsed = datetime.now() - start_time
         enter_count = sum(1 for d in decisions if d.get("verdict") == "ENTER")
@@ -237,4 +251,4 @@ def main():
         return 1
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    exit(main())
\ No newline at end of file
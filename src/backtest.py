@@ -3,19 +3,40 @@ import polars as pl
 import pandas as pd
 import numpy as np
 from .filters.stat_filters import slope_direction_ok
+from .stats import _ols_closed_form
 
-def merge_close_series(a: pl.DataFrame, b: pl.DataFrame) -> pd.DataFrame:
-    da = a.select(["date", "close"]).to_pandas().set_index("date")
-    db = b.select(["date", "close"]).to_pandas().set_index("date")
+def close_frame(df: pl.DataFrame) -> pd.DataFrame:
+    return df.select(["date", "close"]).to_pandas().set_index("date")
+
+def merge_close_series(a: "pl.DataFrame | pd.DataFrame", b: "pl.DataFrame | pd.DataFrame") -> pd.DataFrame:
+    # accepte aussi des close_frame() déjà convertis (réutilisés d'une paire à l'autre)
+    da = a if isinstance(a, pd.DataFrame) else close_frame(a)
+    db = b if isinstance(b, pd.DataFrame) else close_frame(b)
     df = da.join(db, how="inner", lsuffix="_a", rsuffix="_b")
     df.columns = ["ya", "xb"]
     df = df.reset_index().rename(columns={"index": "date"})
     return df
 
+def _trailing_slopes(z: np.ndarray, lookback: int) -> np.ndarray:
+    # pente OLS des `lookback` derniers z non-NaN jusqu'à chaque barre (même critère que
+    # slope_direction_ok sur z[:i+1]), calculée en une passe; NaN tant que l'historique est trop court
+    from numpy.lib.stride_tricks import sliding_window_view
+    ok = ~np.isnan(z)
+    vals = z[ok]
+    out = np.full(len(z), np.nan)
+    if len(vals) < lookback:
+        return out
+    xc = np.arange(lookback) - (lookback - 1) / 2.0
+    w = sliding_window_view(vals, lookback)
+    # fenêtre plate (prix forward-fillés) → pente exactement 0, sans résidu d'arrondi de signe aléatoire: pas de confirmation
+    slopes = np.where(w.max(axis=1) == w.min(axis=1), 0.0, w @ xc / (xc @ xc))
+    k = np.cumsum(ok)
+    bars = k >= max(lookback, 3)
+    out[bars] = slopes[k[bars] - lookback]
+    return out
+
 def _ols_beta(y: pd.Series, x: pd.Series) -> tuple[float, float]:
-    X = np.vstack([np.ones(len(x)), x.values]).T
-    alpha, beta = np.linalg.lstsq(X, y.values, rcond=None)[0]
-    return float(alpha), float(beta)
+    return _ols_closed_form(y.values, x.values)
 
 def simulate_pair(
     df_merged: "pl.DataFrame | pd.DataFrame",
@@ -61,6 +82,13 @@ def simulate_pair(
     z = (spread - m) / s.replace(0.0, np.nan)
     df["z"] = z
 
+    # confirmation de pente: pentes glissantes précalculées (lookback >= 2), sinon chemin historique
+    if slope_confirm and int(slope_lookback) >= 2:
+        slope_at = _trailing_slopes(z.to_numpy(dtype=float), int(slope_lookback))
+        slope_ok = lambda i, d: bool(slope_at[i] * d > 0.0)
+    else:
+        slope_ok = lambda i, d: slope_direction_ok(df["z"].iloc[:i+1], slope_lookback, d)
+
     pos = 0
     last_entry = -10**9
     cool_until = -10**9
@@ -72,7 +100,10 @@ def simulate_pair(
     hold_a = 0.0
     hold_b = 0.0
     pnl = 0.0
-    step = []
+
+    # sorties par barre dans des tableaux préalloués (pas de df.loc scalaire à chaque barre)
+    n = len(df)
+    out_pos = np.empty(n); out_sig = np.empty(n); out_step = np.empty(n); out_cum = np.empty(n)
 
     ya_prev = float(df["ya"].iloc[0])
     xb_prev = float(df["xb"].iloc[0])
@@ -87,17 +118,17 @@ def simulate_pair(
             if require_cross:
                 if pd.notna(z_prev):
                     if (z_prev > entry_z) and (zi <= entry_z):
-                        if not slope_confirm or slope_direction_ok(df["z"].iloc[:i+1], slope_lookback, -1):
+                        if not slope_confirm or slope_ok(i, -1):
                             enter_short = True
                     if (z_prev < -entry_z) and (zi >= -entry_z):
-                        if not slope_confirm or slope_direction_ok(df["z"].iloc[:i+1], slope_lookback, 1):
+                        if not slope_confirm or slope_ok(i, 1):
                             enter_long = True
             else:
                 if zi >= entry_z:
-                    if not slope_confirm or slope_direction_ok(df["z"].iloc[:i+1], slope_lookback, -1):
+                    if not slope_confirm or slope_ok(i, -1):
                         enter_short = True
                 elif zi <= -entry_z:
-                    if not slope_confirm or slope_direction_ok(df["z"].iloc[:i+1], slope_lookback, 1):
+                    if not slope_confirm or slope_ok(i, 1):
                         enter_long = True
 
         if enter_short:
@@ -132,7 +163,6 @@ def simulate_pair(
 
         pnl_step = hold_a * dya + hold_b * dxb
         pnl += pnl_step
-        step.append(pnl_step)
 
         if exit_now and pos != 0:
             pos = 0
@@ -141,12 +171,16 @@ def simulate_pair(
             pnl -= 2.0 * cost_leg
             cool_until = i + int(cool_off_bars)
 
-        df.loc[df.index[i], "pos"] = pos
-        df.loc[df.index[i], "signal"] = sig
-        df.loc[df.index[i], "step_pnl"] = pnl_step
-        df.loc[df.index[i], "cum_pnl"] = pnl
+        out_pos[i] = pos
+        out_sig[i] = sig
+        out_step[i] = pnl_step
+        out_cum[i] = pnl
 
         z_prev = zi
 
+    df["pos"] = out_pos
+    df["signal"] = out_sig
+    df["step_pnl"] = out_step
+    df["cum_pnl"] = out_cum
     j = df[["date", "z", "pos", "signal", "step_pnl", "cum_pnl"]].copy().set_index("date")
     return float(j["cum_pnl"].iloc[-1]), j
@@ -1,10 +1,17 @@
 from __future__ import annotations
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
 from typing import Iterable, List
 import pandas as pd
 import polars as pl
 import numpy as np
 
+from .provenance import prov_path, write_json_atomic
+
 def _root_dir_for_source(params: dict) -> Path:
     data = params.get("data", {})
     src = data.get("source", "yahoo").lower()
@@ -14,16 +21,26 @@ def _root_dir_for_source(params: dict) -> Path:
 
 def _write_provenance(root: Path, source: str) -> None:
     root.mkdir(parents=True, exist_ok=True)
-    Path(root, "_PROVENANCE.json").write_text(
-        pd.Series({"source": source, "updated_at": pd.Timestamp.utcnow().isoformat()}).to_json(),
-        encoding="utf-8"
-    )
+    write_json_atomic(prov_path(root), {"source": source, "updated_at": datetime.now(timezone.utc).isoformat()},
+                      separators=(",", ":"))
+
+_MASTER = "_ALL.parquet"
+_PX_COLS = ["date","open","high","low","close","adj_close","volume"]
+# zstd-3 + stats min/max par row group (les contrôles adjust_prices lisent les dates dans le footer)
+_PARQUET_OPTS = {"compression": "zstd", "compression_level": 3, "statistics": True}
+
+_OHLC = ["open","high","low","close","adj_close"]
+
+def _price_dtype(params: dict) -> pl.DataType:
+    # float32 en option (moitié des octets OHLC); le volume reste float64 (entiers > 2^24 exacts)
+    return pl.Float32 if str(params.get("data", {}).get("price_dtype", "float64")).lower() == "float32" else pl.Float64
 
-def _write_parquet(root: Path, ticker: str, df: pd.DataFrame) -> None:
-    df = df.copy()
-    df["date"] = pd.to_datetime(df["date"]).dt.date
-    cols = ["date","open","high","low","close","adj_close","volume"]
-    pl.from_pandas(df[cols]).write_parquet(root / f"{ticker}.parquet")
+def _write_parquet(root: Path, ticker: str, df: pd.DataFrame | pl.DataFrame, price_dtype: pl.DataType = pl.Float64) -> None:
+    if not isinstance(df, pl.DataFrame):
+        df = df.copy()
+        df["date"] = pd.to_datetime(df["date"]).dt.date
+        df = pl.from_pandas(df[_PX_COLS])
+    df.select(_PX_COLS).with_columns(pl.col(_OHLC).cast(price_dtype)).write_parquet(root / f"{ticker}.parquet", **_PARQUET_OPTS)
 
 def _fmt_prog(i: int, n: int, t: str) -> str:
     w = len(str(n))
@@ -42,52 +59,136 @@ def _to_1d(s: pd.Series | pd.DataFrame) -> pd.Series:
         raise ValueError(f"Colonne inattendue 2D: shape={s.shape}")
     return s
 
-def _ingest_yahoo(params: dict, tickers: Iterable[str]) -> Path:
+# Noms yfinance (capitalisés ou non) → schéma maison, résolus une fois au chargement du module
+_YF_RENAME = {"Open":"open","High":"high","Low":"low","Close":"close","Adj Close":"adj_close","Volume":"volume"}
+_YF_RENAME = {**{k.lower(): v for k, v in _YF_RENAME.items()}, **_YF_RENAME}
+
+def _normalize_yahoo(df: pd.DataFrame | None) -> pd.DataFrame | None:
+    if df is None or df.empty:
+        return None
+    # un seul rename puis une seule construction (float64, 1D forcé), sans boucles de with/rename par colonne
+    df = _flatten_yf_columns(df).rename(columns=_YF_RENAME)
+    col = lambda c: _to_1d(df[c]).to_numpy(dtype=float)
+    close = col("close")
+    return pd.DataFrame({
+        "date": pd.to_datetime(df.index),
+        "open": col("open"),
+        "high": col("high"),
+        "low": col("low"),
+        "close": close,
+        "adj_close": col("adj_close") if "adj_close" in df.columns else close,
+        "volume": col("volume"),
+    })
+
+_YAHOO_CHUNK = 20
+
+def _fetch_yahoo_chunk(chunk: list[str]) -> dict[str, pd.DataFrame | None]:
+    # un yf.download multi-symboles par paquet; les dates sont alignées sur l'union du paquet,
+    # d'où le dropna sur Close pour retrouver l'historique propre à chaque ticker
     import yfinance as yf
+    raw = yf.download(chunk, period="max", interval="1d", auto_adjust=False, progress=False, group_by="ticker", threads=True)
+    out: dict[str, pd.DataFrame | None] = {}
+    multi = raw is not None and isinstance(raw.columns, pd.MultiIndex)
+    for t in chunk:
+        if raw is None or raw.empty:
+            sub = None
+        elif multi:
+            sub = raw[t] if t in raw.columns.get_level_values(0) else None
+        else:
+            # colonnes à plat (paquet d'un seul symbole selon la version de yfinance), comme _yahoo_batch
+            sub = raw if len(chunk) == 1 else None
+        out[t] = _normalize_yahoo(sub.dropna(subset=["Close"]).copy()) if sub is not None and "Close" in sub.columns else None
+    return out
+
+def _ingest_yahoo(params: dict, tickers: Iterable[str], threads: int | None = None) -> Path:
+    from concurrent.futures import ThreadPoolExecutor, as_completed
     root = _root_dir_for_source(params)
     root.mkdir(parents=True, exist_ok=True)
 
     tickers = list(tickers)
     n = len(tickers)
-    ok = 0
-    for i, t in enumerate(tickers, start=1):
-        print(f"[Yahoo] {_fmt_prog(i,n,t)} …")
-        df = yf.download(t, period="max", interval="1d", auto_adjust=False, progress=False, group_by="column", threads=False)
-        if df is None or df.empty:
-            print(f"   [ERR] {t}: vide")
-            continue
-        df = _flatten_yf_columns(df)
-        # uniformise noms
-        ren = {"Open":"open","High":"high","Low":"low","Close":"close","Adj Close":"adj_close","Volume":"volume"}
-        for k in list(ren.keys()):
-            if k not in df.columns and k.lower() in df.columns:
-                df.rename(columns={k.lower(): ren[k]}, inplace=True)
-        df.rename(columns=ren, inplace=True)
-
-        # force 1D
-        for c in ["open","high","low","close","adj_close","volume"]:
-            if c in df.columns:
-                df[c] = _to_1d(df[c])
-
-        df = df.reset_index().rename(columns={"Date":"date"})
-        out = pd.DataFrame({
-            "date": pd.to_datetime(df["date"]),
-            "open": df["open"].astype(float),
-            "high": df["high"].astype(float),
-            "low": df["low"].astype(float),
-            "close": df["close"].astype(float),
-            "adj_close": df["adj_close"].astype(float) if "adj_close" in df.columns else df["close"].astype(float),
-            "volume": df["volume"].astype(float),
-        })
-        _write_parquet(root, t, out)
-        ok += 1
+    # paquets de _YAHOO_CHUNK symboles, téléchargés en parallèle; un fichier parquet par ticker
+    threads = max(1, int(threads or params.get("data", {}).get("yahoo_threads", 8)))
+    price_dtype = _price_dtype(params)
+    chunks = [tickers[i:i + _YAHOO_CHUNK] for i in range(0, n, _YAHOO_CHUNK)]
+    ok = 0; i = 0
+    with ThreadPoolExecutor(max_workers=min(threads, max(1, len(chunks)))) as ex:
+        futs = {ex.submit(_fetch_yahoo_chunk, c): c for c in chunks}
+        for fut in as_completed(futs):
+            try:
+                res = fut.result()
+            except Exception as e:
+                res = {t: e for t in futs[fut]}
+            for t, out in res.items():
+                i += 1
+                print(f"[Yahoo] {_fmt_prog(i,n,t)} …")
+                if isinstance(out, Exception):
+                    print(f"   [ERR] {t}: {out}")
+                    continue
+                if out is None:
+                    print(f"   [ERR] {t}: vide")
+                    continue
+                _write_parquet(root, t, out, price_dtype)
+                ok += 1
 
     _write_provenance(root, "yahoo")
     print(f"[Yahoo] Terminé. OK={ok}/{n} → {root}")
     return root
 
+def _ibkr_bars_to_frame(bars) -> pl.DataFrame:
+    # BarData → polars directement (pas de détour pandas); adj_close = close (ADJUSTED_LAST ou TRADES)
+    if not bars:
+        raise ValueError("aucune barre historique")
+    close = [float(b.close) for b in bars]
+    return pl.DataFrame({
+        "date": [b.date for b in bars],
+        "open": [float(b.open) for b in bars],
+        "high": [float(b.high) for b in bars],
+        "low": [float(b.low) for b in bars],
+        "close": close,
+        "adj_close": close,
+        "volume": [float(b.volume) for b in bars],
+    }).with_columns(pl.col("date").cast(pl.Date))
+
+class _TokenBucket:
+    """Limiteur asyncio à seau de jetons: `rate` requêtes par `period` secondes, rafales permises jusqu'à `rate`."""
+
+    def __init__(self, rate: float, period: float = 1.0):
+        self.capacity = float(rate)
+        self.tokens = float(rate)
+        self.fill = float(rate) / float(period)
+        self.t = time.monotonic()
+
+    async def __aenter__(self):
+        # boucle asyncio mono-thread: pas de verrou nécessaire entre coroutines
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.t) * self.fill)
+            self.t = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return self
+            await asyncio.sleep((1.0 - self.tokens) / self.fill)
+
+    async def __aexit__(self, *exc) -> bool:
+        return False
+
+async def _fetch_ibkr_daily(ib, ct, rate: _TokenBucket):
+    async with rate:
+        bars = await ib.reqHistoricalDataAsync(
+            ct, endDateTime="", durationStr="30 Y", barSizeSetting="1 day",
+            whatToShow="ADJUSTED_LAST", useRTH=True, formatDate=1
+        )
+    if not bars:
+        async with rate:
+            bars = await ib.reqHistoricalDataAsync(
+                ct, endDateTime="", durationStr="30 Y", barSizeSetting="1 day",
+                whatToShow="TRADES", useRTH=True, formatDate=1
+            )
+    return bars
+
 def _ingest_ibkr(params: dict, tickers: Iterable[str]) -> Path:
-    from ib_insync import IB, util, Stock
+    from ib_insync import IB, Stock
     root = _root_dir_for_source(params)
     root.mkdir(parents=True, exist_ok=True)
 
@@ -95,50 +196,50 @@ def _ingest_ibkr(params: dict, tickers: Iterable[str]) -> Path:
     n = len(tickers)
     mode = params.get("trading", {}).get("mode", "paper").lower()
     port = 7497 if mode == "paper" else 7496
+    # requêtes historiques en vol simultanément (pacing IBKR: rester bien sous ~50 msg/s)
+    concurrency = max(1, int(params.get("data", {}).get("ibkr_concurrency", 6)))
+    price_dtype = _price_dtype(params)
 
     ib = IB()
     ib.connect("127.0.0.1", port, clientId=117, timeout=8)
 
-    ok = 0
-    for i, t in enumerate(tickers, start=1):
-        print(f"[IBKR] {_fmt_prog(i,n,t)} …")
+    sem = asyncio.Semaphore(concurrency)
+    # seau de jetons sous la limite IBKR (~50 msg/s): les réponses rapides ne paient pas de pause fixe
+    rate = _TokenBucket(float(params.get("data", {}).get("ibkr_max_msg_per_sec", 45)), 1.0)
+    contracts: dict = {}
+
+    async def _one(i: int, t: str) -> bool:
         try:
-            ct = ib.qualifyContracts(Stock(t, "SMART", "USD"))[0]
-            bars = ib.reqHistoricalData(
-                ct, endDateTime="", durationStr="30 Y", barSizeSetting="1 day",
-                whatToShow="ADJUSTED_LAST", useRTH=True, formatDate=1
-            )
-            if not bars:
-                bars = ib.reqHistoricalData(
-                    ct, endDateTime="", durationStr="30 Y", barSizeSetting="1 day",
-                    whatToShow="TRADES", useRTH=True, formatDate=1
-                )
-            df = util.df(bars)
-            df = df.rename(columns={"date":"date","open":"open","high":"high","low":"low","close":"close","volume":"volume"})
-            if "date" not in df.columns:
-                # parfois ib_insync renvoie index = date
-                df = df.reset_index().rename(columns={"index":"date"})
-            out = pd.DataFrame({
-                "date": pd.to_datetime(df["date"]),
-                "open": df["open"].astype(float),
-                "high": df["high"].astype(float),
-                "low": df["low"].astype(float),
-                "close": df["close"].astype(float),
-                "adj_close": df["close"].astype(float),
-                "volume": df["volume"].astype(float),
-            })
-            _write_parquet(root, t, out)
+            async with sem:
+                print(f"[IBKR] {_fmt_prog(i,n,t)} …")
+                if t not in contracts:
+                    raise ValueError("contrat introuvable")
+                bars = await _fetch_ibkr_daily(ib, contracts[t], rate)
+            # écriture hors sémaphore: le ticker suivant part pendant qu'on écrit celui-ci
+            out = _ibkr_bars_to_frame(bars)
+            _write_parquet(root, t, out, price_dtype)
             print(f"   [OK] {t}: {len(out)} barres")
-            ok += 1
+            return True
         except Exception as e:
             print(f"   [ERR] {t}: {e}")
+            return False
+
+    async def _all() -> list[bool]:
+        # résolution des contrats en un seul lot pipeliné vers TWS, puis historiques en parallèle
+        async with rate:
+            qualified = await ib.qualifyContractsAsync(*[Stock(t, "SMART", "USD") for t in tickers])
+        contracts.update({c.symbol: c for c in qualified if c is not None and c.conId})
+        return await asyncio.gather(*[_one(i, t) for i, t in enumerate(tickers, start=1)])
 
-    ib.disconnect()
+    try:
+        ok = sum(ib.run(_all()))
+    finally:
+        ib.disconnect()
     _write_provenance(root, "ibkr")
     print(f"[IBKR] Terminé. OK={ok}/{n} → {root}")
     return root
 
-def ensure_universe(params: dict, tickers: Iterable[str]) -> Path:
+def ensure_universe(params: dict, tickers: Iterable[str], threads: int | None = None) -> Path:
     src = params.get("data", {}).get("source", "yahoo").lower()
     root = _root_dir_for_source(params)
     root.mkdir(parents=True, exist_ok=True)
@@ -148,7 +249,7 @@ def ensure_universe(params: dict, tickers: Iterable[str]) -> Path:
 
     if src == "yahoo":
         if missing:
-            return _ingest_yahoo(params, missing)
+            return _ingest_yahoo(params, missing, threads)
         _write_provenance(root, "yahoo")
         return root
 
@@ -160,8 +261,84 @@ def ensure_universe(params: dict, tickers: Iterable[str]) -> Path:
 
     raise ValueError(f"Source inconnue: {src}")
 
+@lru_cache(maxsize=256)
+def _read_price_parquet(path: str, mtime_ns: int) -> pl.DataFrame:
+    # clé = (chemin, mtime): un parquet réécrit (ingestion, ajustement) n'est jamais servi périmé
+    return pl.read_parquet(path).with_columns(pl.col("date").cast(pl.Date))
+
 def get_price_series(root_dir: Path, ticker: str) -> pl.DataFrame:
     path = Path(root_dir) / f"{ticker}.parquet"
-    if not path.exists():
-        raise FileNotFoundError(f"Parquet manquant: {path}")
-    return pl.read_parquet(path)
+    try:
+        mtime_ns = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Parquet manquant: {path}") from None
+    return _read_price_parquet(str(path), mtime_ns)
+
+def write_price_master(root_dir: Path, tickers: Iterable[str]) -> Path:
+    # Un seul parquet (colonne ticker, trié ticker/date): l'univers se relit en un seul scan.
+    # Incrémental: les tickers inchangés depuis le dernier master sont repris du master lui-même
+    # (un scan), seuls les parquets modifiés/nouveaux sont relus; rien n'est réécrit si tout est à jour.
+    root = Path(root_dir)
+    fp = root / _MASTER
+    tickers = [t for t in tickers if (root / f"{t}.parquet").exists()]
+    reuse: list[str] = []
+    if fp.exists() and tickers:
+        mt = fp.stat().st_mtime
+        have = set(pl.scan_parquet(fp).select(pl.col("ticker").unique()).collect()["ticker"].to_list())
+        reuse = [t for t in tickers if t in have and (root / f"{t}.parquet").stat().st_mtime <= mt]
+        if len(reuse) == len(tickers) == len(have):
+            return fp
+    fresh = [t for t in tickers if t not in set(reuse)]
+    # plan lazy (scan → concat → tri) écrit en flux par sink_parquet: pas de matérialisation de l'univers entier
+    frames = [pl.scan_parquet(root / f"{t}.parquet").with_columns(pl.lit(t).alias("ticker")) for t in fresh]
+    if reuse:
+        frames.insert(0, pl.scan_parquet(fp).filter(pl.col("ticker").is_in(reuse)))
+    if frames:
+        tmp = fp.with_name(fp.name + ".tmp")
+        plan = pl.concat(frames, how="diagonal_relaxed").sort(["ticker", "date"])
+        try:
+            plan.sink_parquet(tmp, **_PARQUET_OPTS)
+        except Exception:
+            plan.collect().write_parquet(tmp, **_PARQUET_OPTS)
+        os.replace(tmp, fp)
+    return fp
+
+def load_price_master(root_dir: Path, tickers: Iterable[str]) -> dict[str, pl.DataFrame]:
+    # Séries lues depuis le master; seuls les tickers dont le parquet n'a pas bougé depuis sont servis
+    # (les autres → get_price_series)
+    root = Path(root_dir)
+    fp = root / _MASTER
+    if not fp.exists():
+        return {}
+    mt = fp.stat().st_mtime
+    fresh = [t for t in tickers if (root / f"{t}.parquet").exists() and (root / f"{t}.parquet").stat().st_mtime <= mt]
+    if not fresh:
+        return {}
+    df = pl.scan_parquet(fp).filter(pl.col("ticker").is_in(fresh)).collect()
+    out = {}
+    for k, part in df.partition_by("ticker", as_dict=True).items():
+        t = k[0] if isinstance(k, tuple) else k
+        # schéma fixe _PX_COLS toujours présent (nulls conservés, ex. adj_close pas encore reconstruit);
+        # les colonnes annexes absentes du fichier d'origine (concat diagonale → toutes nulles) sont retirées
+        extra = [c for c in part.columns if c not in _PX_COLS and c != "ticker" and part[c].null_count() < part.height]
+        out[t] = part.select([pl.col(c) if c in part.columns else pl.lit(None, pl.Float64).alias(c) for c in _PX_COLS] + extra)
+    return out
+
+def load_price_series_many(root_dir: Path, tickers: Iterable[str]) -> dict[str, pl.DataFrame]:
+    # master d'abord, puis un seul scan multi-fichiers (parallèle) pour le reste;
+    # schémas hétérogènes ou polars trop ancien → lecture fichier par fichier
+    root = Path(root_dir)
+    tickers = list(tickers)
+    out = load_price_master(root, tickers)
+    rest = [t for t in tickers if t not in out and (root / f"{t}.parquet").exists()]
+    if not rest:
+        return out
+    try:
+        df = pl.scan_parquet([str(root / f"{t}.parquet") for t in rest], include_file_paths="_path").collect()
+        for k, part in df.partition_by("_path", as_dict=True).items():
+            p = k[0] if isinstance(k, tuple) else k
+            out[Path(p).stem] = part.drop("_path")
+    except Exception:
+        for t in rest:
+            out[t] = get_price_series(root, t)
+    return out
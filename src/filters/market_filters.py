@@ -8,8 +8,8 @@ ET = ZoneInfo("America/New_York")
 
 def vix_ok(vix_path: str | Path, vix_max: float) -> bool:
     try:
-        df = pl.read_parquet(vix_path).select(['date','close']).sort('date').to_pandas().set_index('date')
-        last = float(df['close'].iloc[-1])
+        # plan lazy: seule la dernière clôture est matérialisée (pas d'aller-retour pandas)
+        last = float(pl.scan_parquet(vix_path).select(['date','close']).sort('date').tail(1).collect()['close'][0])
         return last <= vix_max
     except Exception:
         return True
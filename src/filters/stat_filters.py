@@ -3,6 +3,7 @@ import numpy as np
 import pandas as pd
 from statsmodels.tsa.stattools import adfuller
 import statsmodels.api as sm
+from ..stats import rolling_mean_std
 
 def hedge_ratio(y: pd.Series, x: pd.Series) -> tuple[float,float]:
     x_ = sm.add_constant(x.values, has_constant='add')
@@ -31,8 +32,10 @@ def coint_adf(spread: pd.Series) -> float:
         return 1.0
 
 def zscore(series: pd.Series, win: int) -> pd.Series:
-    r = series.rolling(win)
-    return (series - r.mean()) / r.std(ddof=0)
+    x = series.to_numpy(dtype=float)
+    mu, sd = rolling_mean_std(x, win, ddof=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return pd.Series((x - mu) / sd, index=series.index, name=series.name)
 
 def stable_half_life(y: pd.Series, x: pd.Series, hl_min: float, hl_max: float, tol: float) -> tuple[bool, float]:
     alpha, beta = hedge_ratio(y, x)
@@ -1,8 +1,9 @@
 import itertools
+import numpy as np
 import pandas as pd
 from statsmodels.tsa.stattools import coint
 
-from src.stats import _beta_ols, _halflife_ar1
+from src.stats import _beta_ols, _halflife_ar1, _ols_closed_form
 
 def all_pairs_from_universe(tickers: list[str]) -> list[tuple[str,str]]:
     return [(a,b) for a,b in itertools.combinations(tickers, 2)]
@@ -14,27 +15,65 @@ def _corr_last_window(s1: pd.Series, s2: pd.Series, days: int) -> float:
     r2 = s2.loc[idx].pct_change().tail(days)
     return float(r1.corr(r2))
 
+def _coint_arrays(y: np.ndarray, x: np.ndarray) -> float:
+    if len(y) < 60: return 1.0
+    try:
+        _, pval, _ = coint(y, x)
+        return float(pval)
+    except Exception:
+        return 1.0
+
 def _coint_pval(s1: pd.Series, s2: pd.Series, days: int) -> float:
     idx = s1.dropna().index.intersection(s2.dropna().index)
     s1w = s1.loc[idx].tail(days).dropna()
     s2w = s2.loc[idx].tail(days).dropna()
     idx2 = s1w.index.intersection(s2w.index)
     if len(idx2) < 60: return 1.0
-    try:
-        _, pval, _ = coint(s1w.values, s2w.values)
-        return float(pval)
-    except Exception:
-        return 1.0
+    return _coint_arrays(s1w.values, s2w.values)
+
+def _valid_tail(price_map: dict[str, pd.DataFrame], tickers: list[str]) -> np.ndarray:
+    # Matrice alignée (dates × tickers) réduite au plus long bloc final où tous les tickers cotent,
+    # stockée par colonne (Fortran) : chaque paire lit deux colonnes contiguës.
+    # Sur ce bloc, la queue de chaque intersection de paire est exactement la queue de la matrice.
+    wide = pd.concat({t: price_map[t]["close"] for t in tickers}, axis=1)
+    tail_all = wide.notna().to_numpy()[::-1].all(axis=1)
+    n_ok = len(tail_all) if tail_all.all() else int(np.argmin(tail_all))
+    return np.asfortranarray(wide.to_numpy(dtype=float)[len(tail_all) - n_ok:])
+
+def _corr_from_tail(px: np.ndarray) -> np.ndarray:
+    # Corrélations de toutes les paires en un seul np.corrcoef sur les rendements de la matrice alignée
+    rets = px[1:] / px[:-1] - 1.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.atleast_2d(np.corrcoef(rets, rowvar=False))
 
-def score_pairs(price_map: dict[str, pd.DataFrame], pairs: list[tuple[str,str]], corr_days: int, coint_days: int) -> pd.DataFrame:
+def score_pairs(price_map: dict[str, pd.DataFrame], pairs: list[tuple[str,str]], corr_days: int, coint_days: int,
+                coint_min_corr: float | None = None) -> pd.DataFrame:
+    tickers = sorted({t for p in pairs for t in p})
+    col = {t: i for i, t in enumerate(tickers)}
+    X = _valid_tail(price_map, tickers) if pairs else np.empty((0, 0))
+    C = _corr_from_tail(X[-(corr_days + 1):]) if len(X) >= corr_days + 1 else None
+    # queue commune à tout l'univers sur coint_days: coint/beta/demi-vie lus en colonnes de X
+    W = X[-coint_days:] if len(X) >= coint_days else None
     rows = []
     for a,b in pairs:
+        i, j = col[a], col[b]
         s1 = price_map[a]["close"]; s2 = price_map[b]["close"]
-        corr = _corr_last_window(s1, s2, corr_days)
-        pval = _coint_pval(s1, s2, coint_days)
+        corr = float(C[i, j]) if C is not None else _corr_last_window(s1, s2, corr_days)
+        # coint (le plus coûteux) uniquement pour les paires qui passent le seuil de corrélation
+        if coint_min_corr is not None and not (pd.notna(corr) and corr >= coint_min_corr):
+            pval = 1.0
+        elif W is not None:
+            pval = _coint_arrays(W[:, i], W[:, j])
+        else:
+            pval = _coint_pval(s1, s2, coint_days)
         score = (corr if pd.notna(corr) else 0.0) - pval
-        alpha, beta = _beta_ols(price_map[a]['close'].iloc[-coint_days:], price_map[b]['close'].iloc[-coint_days:])
-        spread = price_map[a]['close'].iloc[-coint_days:] - (alpha + beta*price_map[b]['close'].iloc[-coint_days:])
+        if W is not None:
+            ya, xb = W[:, i], W[:, j]
+            alpha, beta = _ols_closed_form(ya, xb)
+            spread = pd.Series(ya - (alpha + beta*xb))
+        else:
+            alpha, beta = _beta_ols(s1.iloc[-coint_days:], s2.iloc[-coint_days:])
+            spread = s1.iloc[-coint_days:] - (alpha + beta*s2.iloc[-coint_days:])
         half_life = _halflife_ar1(spread)
         rows.append({"a":a,"b":b,"corr":corr,"pval":pval,"score":score, "half_life":half_life})
     df = pd.DataFrame(rows).sort_values("score", ascending=False).reset_index(drop=True)
@@ -60,4 +99,4 @@ def select_top_pairs(scored_df, params):
         (scored_df["half_life"] <= max_hl) &
         (scored_df["pval"] <= max_pval)
     )
-    return scored_df.loc[filt].sort_values("score", ascending=False).head(topk).copy()
+    return scored_df.loc[filt].nlargest(topk, "score").copy()
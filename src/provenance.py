@@ -1,6 +1,6 @@
 from __future__ import annotations
 from pathlib import Path
-import json
+import json, os
 from datetime import datetime
 
 PROV_FILE = "_PROVENANCE.json"
@@ -8,6 +8,12 @@ PROV_FILE = "_PROVENANCE.json"
 def prov_path(root_dir: Path | str) -> Path:
     return Path(root_dir) / PROV_FILE
 
+def write_json_atomic(p: Path, data: dict, **dumps_kw) -> None:
+    # .tmp puis os.replace: un run interrompu ne laisse jamais un _PROVENANCE.json tronqué
+    tmp = p.with_name(p.name + ".tmp")
+    tmp.write_text(json.dumps(data, **dumps_kw), encoding="utf-8")
+    os.replace(tmp, p)
+
 def read_provenance(root_dir: Path | str) -> dict | None:
     p = prov_path(root_dir)
     if not p.exists():
@@ -20,7 +26,7 @@ def read_provenance(root_dir: Path | str) -> dict | None:
 def save_provenance(root_dir: Path | str, source: str) -> dict:
     p = prov_path(root_dir)
     data = {"source": source, "updated_at": datetime.utcnow().isoformat() + "Z"}
-    p.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json_atomic(p, data, ensure_ascii=False, indent=2)
     return data
 
 def enforce_provenance(root_dir: Path | str, expected_source: str, allow_unknown: bool = False) -> None:
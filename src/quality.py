@@ -1,6 +1,7 @@
 from __future__ import annotations
 from pathlib import Path
 import json
+import threading
 import polars as pl
 import pandas as pd
 from datetime import datetime
@@ -8,10 +9,13 @@ from datetime import datetime
 def _now_str() -> str:
     return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
 
+# les scripts chargent les tickers en parallèle: un seul écrivain à la fois sur le log QA
+_QA_LOCK = threading.Lock()
+
 def write_qa_log(path: Path | str, lines: list[str]) -> None:
     p = Path(path)
     p.parent.mkdir(parents=True, exist_ok=True)
-    with p.open("a", encoding="utf-8") as f:
+    with _QA_LOCK, p.open("a", encoding="utf-8") as f:
         for line in lines:
             f.write(line.rstrip() + "\n")
 
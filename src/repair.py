@@ -2,6 +2,8 @@ from __future__ import annotations
 from pathlib import Path
 import polars as pl
 
+from .data import _PARQUET_OPTS
+
 def _compute_is_ex_div(df: pl.DataFrame, tol_bp: int = 1) -> pl.DataFrame:
     if "adj_close" not in df.columns or "close" not in df.columns:
         return df.with_columns(pl.lit(False).alias("is_ex_div"))
@@ -20,7 +22,7 @@ def ensure_is_ex_div(parquet_path: Path, tol_bp: int = 1) -> bool:
     if "is_ex_div" in df.columns:
         return True
     out = _compute_is_ex_div(df, tol_bp=tol_bp)
-    out.write_parquet(parquet_path)
+    out.write_parquet(parquet_path, **_PARQUET_OPTS)
     return True
 
 def ensure_folder_has_is_ex_div(root_dir: Path, tickers: list[str], tol_bp: int = 1) -> dict:
@@ -78,11 +78,17 @@ def generate_reports_bundle(tickers: list[str], root_dir: Path, top_pairs: pd.Da
     except Exception:
         spy = None
 
+    # un seul chargement/conversion par ticker (px déjà coalescé côté polars), partagé entre paires
+    frames: dict[str, pd.DataFrame] = {}
+    def _frame(t: str) -> pd.DataFrame:
+        if t not in frames:
+            frames[t] = load_price_df(root_dir, t).to_pandas().set_index("date")
+        return frames[t]
+
     rows = []; last_price_date = None
     for _, row in top_pairs.iterrows():
         a, b = row["a"], row["b"]
-        dfa = load_price_df(root_dir, a).to_pandas().set_index("date")
-        dfb = load_price_df(root_dir, b).to_pandas().set_index("date")
+        dfa = _frame(a); dfb = _frame(b)
         ya = dfa["px"].rename(a); xb = dfb["px"].rename(b)
         common_idx = ya.dropna().index.intersection(xb.dropna().index)
         if len(common_idx) == 0:
@@ -13,11 +13,7 @@ def ols_hedge_ratio(y: pd.Series, x: pd.Series) -> tuple[float, float]:
     s = pd.concat([y, x], axis=1).dropna()
     if len(s) < 5:
         return 0.0, 1.0
-    X = np.column_stack([np.ones(len(s)), s.iloc[:,1].values])
-    yv = s.iloc[:,0].values
-    beta_hat = np.linalg.lstsq(X, yv, rcond=None)[0]
-    alpha, beta = float(beta_hat[0]), float(beta_hat[1])
-    return alpha, beta
+    return _ols_closed_form(s.iloc[:,0].values, s.iloc[:,1].values)
 
 def spread_series(y: pd.Series, x: pd.Series, alpha: float, beta: float) -> pd.Series:
     s = pd.concat([y, x], axis=1).dropna()
@@ -75,15 +71,65 @@ def compute_coint_stats(y: pd.Series, x: pd.Series, lookback: int) -> tuple[floa
             pval = 0.2
     return (float(pval), float(hl) if not np.isnan(hl) else np.inf, sigma, alpha, beta)
 
+# variance relative (var/mean²) sous laquelle une fenêtre est jugée constante (résidu d'arrondi des sommes cumulées)
+_VAR_REL_EPS = 1e-12
+
+def rolling_mean_std(x: np.ndarray, win: int, ddof: int = 1) -> tuple[np.ndarray, np.ndarray]:
+    # équivalent O(N) de rolling(win).mean()/std(ddof) par sommes cumulées (série centrée: moins d'annulation);
+    # fenêtres constantes (exactes ou à l'arrondi près) → écart-type NaN, jamais un résidu ~1e-7 qui ferait exploser z
+    x = np.asarray(x, dtype=float)
+    n = len(x)
+    m = np.full(n, np.nan); sd = np.full(n, np.nan)
+    if win <= ddof or n < win:
+        return m, sd
+    valid = ~np.isnan(x)
+    mu = float(x[valid].mean()) if valid.any() else 0.0
+    xc = np.where(valid, x - mu, 0.0)
+    cs = np.concatenate(([0.0], np.cumsum(xc)))
+    cs2 = np.concatenate(([0.0], np.cumsum(xc * xc)))
+    cn = np.concatenate(([0], np.cumsum(~valid)))
+    s1 = cs[win:] - cs[:-win]
+    s2 = cs2[win:] - cs2[:-win]
+    var = np.maximum((s2 - s1 * s1 / win) / (win - ddof), 0.0)
+    has_nan = (cn[win:] - cn[:-win]) > 0
+    mean = s1 / win + mu
+    # changements de valeur d'un pas à l'autre: aucun dans la fenêtre ⇒ constante exacte (cas mean == 0 inclus)
+    cc = np.concatenate(([0, 0], np.cumsum(x[1:] != x[:-1])))
+    flat = (cc[win:] - cc[1:n - win + 2]) == 0
+    flat |= var <= _VAR_REL_EPS * mean * mean
+    m[win - 1:] = np.where(has_nan, np.nan, mean)
+    sd[win - 1:] = np.where(has_nan | flat, np.nan, np.sqrt(var))
+    return m, sd
+
+def pair_betas(Y: np.ndarray, X: np.ndarray, keep: np.ndarray) -> np.ndarray:
+    # beta = cov/var (sans constante) de chaque colonne Y[:,p] sur X[:,p], restreint aux lignes keep[:,p]; 1.0 si dégénéré
+    n = keep.sum(axis=0)
+    Xk = np.where(keep, X, 0.0); Yk = np.where(keep, Y, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dx = np.where(keep, X - Xk.sum(axis=0) / n, 0.0)
+        dy = np.where(keep, Y - Yk.sum(axis=0) / n, 0.0)
+        sxx = np.einsum("tp,tp->p", dx, dx)
+        beta = np.einsum("tp,tp->p", dx, dy) / sxx
+    return np.where((n >= 2) & (sxx != 0.0), beta, 1.0)
+
+def pair_zscore(ya: np.ndarray, xb: np.ndarray, win: int, beta: float | None = None) -> tuple[float, np.ndarray, np.ndarray]:
+    # spread = ya - beta*xb et z glissant, sur tableaux float64 sans NaN (beta calculé si non fourni)
+    ya = np.asarray(ya, dtype=np.float64); xb = np.asarray(xb, dtype=np.float64)
+    if beta is None:
+        beta = float(pair_betas(ya[:, None], xb[:, None], np.ones((len(ya), 1), dtype=bool))[0])
+    spread = ya - beta * xb
+    m, sd = rolling_mean_std(spread, win, ddof=1)
+    z = (spread - m) / np.where(sd == 0.0, np.nan, sd)
+    return beta, spread, z
+
 def zscore(series: pd.Series, win: int) -> pd.Series:
     s = series.dropna()
     if len(s) < win:
         return pd.Series(index=s.index, dtype=float, name='z')
-    mu = s.rolling(win).mean()
-    sd = s.rolling(win).std(ddof=1)
-    z = (s - mu) / sd
-    z.name = 'z'
-    return z
+    x = s.to_numpy(dtype=float)
+    mu, sd = rolling_mean_std(x, win, ddof=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return pd.Series((x - mu) / sd, index=s.index, name='z')
 
 def combine_score(rho: float, pval: float, half_life: float, sigma_spread: float) -> float:
     if any([np.isnan(rho), np.isnan(pval), np.isnan(half_life), np.isnan(sigma_spread)]):
@@ -94,11 +140,21 @@ def combine_score(rho: float, pval: float, half_life: float, sigma_spread: float
     s4 = 1.0 / (1.0 + sigma_spread)
     return float(2.0*s1 + 1.5*s2 + 1.0*s3 + 0.5*s4)
 
+def _ols_closed_form(yv: np.ndarray, xv: np.ndarray) -> tuple[float, float]:
+    # y = α + βx: β = cov(x,y)/var(x), α = ȳ − βx̄ (same solution as lstsq on [1, x])
+    yv = np.asarray(yv, dtype=float); xv = np.asarray(xv, dtype=float)
+    xm = xv.mean(); ym = yv.mean()
+    xc = xv - xm
+    sxx = float(xc @ xc)
+    if sxx == 0.0:
+        X = np.column_stack([np.ones(len(xv)), xv])
+        alpha, beta = np.linalg.lstsq(X, yv, rcond=None)[0]
+        return float(alpha), float(beta)
+    beta = float(xc @ (yv - ym)) / sxx
+    return float(ym - beta * xm), beta
+
 def _beta_ols(y, x):
-    x_ = np.vstack([np.ones(len(x)), x.values]).T
-    b = np.linalg.lstsq(x_, y.values, rcond=None)[0]
-    alpha, beta = float(b[0]), float(b[1])
-    return alpha, beta
+    return _ols_closed_form(y.values, x.values)
 
 def _halflife_ar1(series: pd.Series) -> float:
     s = pd.Series(series).dropna()
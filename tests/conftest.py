@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+# Les scripts s'importent comme modules (pas de package scripts/), src via la racine du repo
+_ROOT = Path(__file__).resolve().parents[1]
+for p in (_ROOT, _ROOT / "scripts"):
+    if str(p) not in sys.path:
+        sys.path.insert(0, str(p))
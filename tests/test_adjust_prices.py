@@ -0,0 +1,73 @@
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+import polars as pl
+
+import adjust_prices
+
+
+def _write_ingest_file(fp, n=30, dtype=pl.Float32):
+    days = [date(2024, 1, 1) + timedelta(days=i) for i in range(n)]
+    px = np.linspace(100.0, 110.0, n)
+    pl.DataFrame({
+        "date": days, "open": px, "high": px + 1, "low": px - 1, "close": px,
+        "adj_close": [None] * n, "volume": np.full(n, 1e6),
+    }, schema_overrides={"adj_close": pl.Float64}).with_columns(
+        pl.col(["open", "high", "low", "close", "adj_close"]).cast(dtype)
+    ).write_parquet(fp)
+    return days, px
+
+
+def _yahoo_payload(days, px):
+    idx = pd.DatetimeIndex(days)
+    yh = pd.DataFrame({"Close": px, "AdjClose": px * 0.98}, index=idx)
+    div = pd.Series([0.5], index=idx[[10]])
+    return yh, div
+
+
+def test_process_one_keeps_float32_prices(tmp_path):
+    days, px = _write_ingest_file(tmp_path / "SPY.parquet")
+    ok, status = adjust_prices._process_one(tmp_path, "SPY", True, _yahoo_payload(days, px), pl.Float32)
+    assert ok, status
+
+    schema = pl.read_parquet_schema(tmp_path / "SPY.parquet")
+    for c in ("open", "high", "low", "close", "adj_close"):
+        assert schema[c] == pl.Float32, c
+    assert schema["volume"] == pl.Float64
+    out = pl.read_parquet(tmp_path / "SPY.parquet")
+    assert out["adj_close"].null_count() == 0
+    assert out["is_ex_div"].sum() == 1
+
+
+def test_process_one_default_float64(tmp_path):
+    days, px = _write_ingest_file(tmp_path / "SPY.parquet", dtype=pl.Float64)
+    ok, status = adjust_prices._process_one(tmp_path, "SPY", True, _yahoo_payload(days, px))
+    assert ok, status
+    assert pl.read_parquet_schema(tmp_path / "SPY.parquet")["adj_close"] == pl.Float64
+
+
+def test_rebuild_plan_skips_corrupt_file(tmp_path):
+    (tmp_path / "BAD.parquet").write_bytes(b"PAR1 truncated")
+    ok, status, window = adjust_prices._rebuild_plan(tmp_path, "BAD", False)
+    assert not ok and window is None and status
+    assert adjust_prices._process_one(tmp_path, "BAD", False, plan=(ok, status, window)) == (False, status)
+    assert adjust_prices._rebuild_plan(tmp_path, "MISSING", False) == (False, "File not found", None)
+
+
+def test_yahoo_cache_roundtrip_and_prune(tmp_path):
+    import os, time
+    cache = adjust_prices.YahooCache.from_params({"data": {"yahoo_cache_dir": str(tmp_path), "yahoo_cache_ttl_hours": 1}})
+    days = [date(2024, 1, 1) + timedelta(days=i) for i in range(5)]
+    yh, div = _yahoo_payload(days * 3, np.arange(15.0) + 1)
+    adjust_prices._write_disk_cache(cache, "SPY", "2024-01-01", yh, div)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["SPY_2024-01-01_div.parquet", "SPY_2024-01-01_hist.parquet"]
+    df, d = adjust_prices._read_disk_cache(cache, "SPY", "2024-01-01")
+    assert len(df) == 15 and len(d) == 1
+
+    old = time.time() - 2 * 3600
+    for p in tmp_path.iterdir():
+        os.utime(p, (old, old))
+    assert adjust_prices._read_disk_cache(cache, "SPY", "2024-01-01") is None
+    assert cache.prune() == 2 and not any(tmp_path.iterdir())
+    assert adjust_prices.YahooCache.from_params({"data": {"yahoo_cache_dir": None}}) is None
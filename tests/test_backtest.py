@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+from src.backtest import _trailing_slopes
+from src.filters.stat_filters import slope_direction_ok
+
+
+def test_trailing_slopes_match_polyfit():
+    z = np.random.default_rng(1).normal(size=200)
+    z[[5, 50, 51]] = np.nan
+    s = _trailing_slopes(z, 3)
+    for i in range(len(z)):
+        for d in (1, -1):
+            if np.isnan(s[i]):
+                continue
+            assert bool(s[i] * d > 0.0) == slope_direction_ok(pd.Series(z[:i + 1]), 3, d)
+
+
+def test_trailing_slopes_flat_window_never_confirms():
+    # z aplati (prix forward-fillés): pente exactement 0, aucune confirmation dans un sens ou l'autre
+    # (np.polyfit laissait un résidu ±1e-17 qui confirmait parfois)
+    z = np.r_[np.random.default_rng(2).normal(size=20), np.full(15, 0.7311), np.full(10, -2.1)]
+    for lb in (3, 4, 5):
+        s = _trailing_slopes(z, lb)
+        flat = np.zeros(len(z), dtype=bool)
+        flat[20 + lb - 1:35] = flat[35 + lb - 1:] = True
+        assert (s[flat] == 0.0).all()
@@ -0,0 +1,49 @@
+from datetime import date, timedelta
+
+import polars as pl
+
+from src.data import _PX_COLS, load_price_master, write_price_master
+
+
+def _write(root, ticker, adj, ex_div=None):
+    n = 5
+    df = pl.DataFrame({
+        "date": [date(2024, 1, 1) + timedelta(days=i) for i in range(n)],
+        "open": [1.0] * n, "high": [1.0] * n, "low": [1.0] * n, "close": [1.0] * n,
+        "adj_close": adj, "volume": [1e6] * n,
+    }, schema_overrides={"adj_close": pl.Float64})
+    if ex_div is not None:
+        df = df.with_columns(pl.Series("is_ex_div", ex_div))
+    df.write_parquet(root / f"{ticker}.parquet")
+
+
+def test_load_price_master_keeps_fixed_schema(tmp_path):
+    _write(tmp_path, "SPY", [0.9] * 5, [False] * 5)
+    _write(tmp_path, "NEW", [None] * 5)
+    write_price_master(tmp_path, ["SPY", "NEW"])
+    out = load_price_master(tmp_path, ["SPY", "NEW"])
+
+    assert out["NEW"].columns == _PX_COLS
+    assert out["NEW"]["adj_close"].null_count() == 5
+    assert out["NEW"].select(pl.coalesce(["adj_close", "close"])).to_series().to_list() == [1.0] * 5
+    assert out["SPY"].columns == _PX_COLS + ["is_ex_div"]
+
+
+def _yf_frame(n=4):
+    import pandas as pd
+    idx = pd.date_range("2024-01-01", periods=n)
+    return pd.DataFrame({"Open": 1.0, "High": 1.0, "Low": 1.0, "Close": 1.0, "Adj Close": 0.9, "Volume": 1e6}, index=idx)
+
+
+def test_fetch_yahoo_chunk_flat_and_multiindex(monkeypatch):
+    import pandas as pd
+    import yfinance as yf
+    from src.data import _fetch_yahoo_chunk
+
+    monkeypatch.setattr(yf, "download", lambda *a, **k: _yf_frame())
+    assert len(_fetch_yahoo_chunk(["SPY"])["SPY"]) == 4
+
+    multi = pd.concat({"SPY": _yf_frame(), "QQQ": _yf_frame()}, axis=1)
+    monkeypatch.setattr(yf, "download", lambda *a, **k: multi)
+    out = _fetch_yahoo_chunk(["SPY", "QQQ", "DIA"])
+    assert len(out["SPY"]) == len(out["QQQ"]) == 4 and out["DIA"] is None
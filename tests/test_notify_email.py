@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+
+from notify_email import _generate_decisions_table
+
+
+def test_decisions_table_verdict_classes_and_na():
+    dec = pd.DataFrame({
+        "a": ["SPY", "QQQ", "DIA", "IWM"], "b": ["XLK"] * 4,
+        "verdict": ["ENTER", "EXIT", None, "SKIP"],
+        "z_last": [1.23456, None, np.nan, 2.0],
+        "hl": pd.Series([None, None, 1.5, None], dtype=object),
+    })
+    html = _generate_decisions_table(dec)
+    assert '<td class="verdict-enter">ENTER</td>' in html
+    assert '<td class="verdict-exit">EXIT</td>' in html
+    assert '<td class="verdict-hold">N/A</td>' in html
+    assert '<td class="verdict-hold">SKIP</td>' in html
+    assert "<td>1.235</td>" in html and "<td>1.500</td>" in html
+    assert "None" not in html and "\x00" not in html
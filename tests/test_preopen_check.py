@@ -0,0 +1,34 @@
+import pytest
+
+import preopen_check
+
+
+def test_read_bundle_csv_requires_verdict(tmp_path):
+    fp = tmp_path / "decisions.csv"
+    fp.write_text("ts,a,b,decision\n2024-01-02,SPY,QQQ,ENTER\n")
+    with pytest.raises(RuntimeError, match="verdict"):
+        preopen_check._read_bundle_csv(fp, preopen_check._DEC_COLS, "Decisions")
+
+
+def test_read_bundle_csv_projects_columns(tmp_path):
+    fp = tmp_path / "orders.csv"
+    fp.write_text("ts,a,b,verdict,qty_a\n2024-01-02,SPY,QQQ,ENTER,3\n")
+    df = preopen_check._read_bundle_csv(fp, preopen_check._ORD_COLS, "Orders")
+    assert list(df.columns) == ["a", "b", "verdict", "qty_a"]
+    assert str(df["verdict"].dtype) == "category"
+
+
+def test_read_bundle_csv_headerless_file_is_empty(tmp_path):
+    # pd.DataFrame().to_csv(...) un jour sans ordres écrit un simple "\n"
+    for name, content in (("orders.csv", "\n"), ("decisions.csv", "\r\n"), ("empty.csv", "")):
+        fp = tmp_path / name
+        fp.write_text(content)
+        assert preopen_check._read_bundle_csv(fp, preopen_check._ORD_COLS, "Orders").empty
+
+
+def test_main_no_orders_day(tmp_path, monkeypatch):
+    import pandas as pd
+    (tmp_path / "decisions.csv").write_text("ts,a,b,verdict\n2024-01-02,SPY,QQQ,HOLD\n")
+    pd.DataFrame().to_csv(tmp_path / "orders.csv", index=False)
+    monkeypatch.setattr("sys.argv", ["preopen_check.py", "--bundle", str(tmp_path)])
+    assert preopen_check.main() == 0
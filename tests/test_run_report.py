@@ -0,0 +1,22 @@
+from datetime import date, timedelta
+
+import numpy as np
+import polars as pl
+
+from run_report import _coalesce_meta
+from src.repair import _compute_is_ex_div
+
+
+def test_coalesce_meta_null_ex_div_flag():
+    n = 6
+    df = _compute_is_ex_div(pl.DataFrame({
+        "date": [date(2024, 1, 1) + timedelta(days=i) for i in range(n)],
+        "close": [10.0] * n,
+        "adj_close": [9.0, 9.0, 9.5, 9.5, None, 9.5],
+    }))
+    assert df["is_ex_div"].null_count() > 0
+
+    out = _coalesce_meta(df)
+    assert out["is_ex_div"].dtype == bool
+    assert out["is_ex_div"].tolist() == [False, False, True, False, False, False]
+    assert np.allclose(out["px"].to_numpy(), [9.0, 9.0, 9.5, 9.5, 10.0, 9.5])
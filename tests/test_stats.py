@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+
+from src.stats import pair_zscore, rolling_mean_std, zscore
+
+
+def test_rolling_mean_std_constant_series():
+    for level in (0.0, 101.3, 1e4):
+        m, sd = rolling_mean_std(np.full(50, level), 20)
+        assert np.allclose(m[19:], level)
+        assert np.isnan(sd).all()
+
+
+def test_constant_window_after_varying_data():
+    x = np.r_[np.random.default_rng(0).normal(100, 5, 300), np.full(40, 101.3)]
+    m, sd = rolling_mean_std(x, 20)
+    assert np.isnan(sd[-21:]).all()
+    assert np.allclose(sd[19:300], pd.Series(x).rolling(20).std().to_numpy()[19:300])
+    assert np.isnan(zscore(pd.Series(x), 20).to_numpy()[-21:]).all()
+    _, _, z = pair_zscore(x, np.zeros_like(x), 20, beta=0.0)
+    assert np.isnan(z[-21:]).all()